@@ -0,0 +1,75 @@
+"""
+Authors: Krzysztof Szymczyk s23210 & Maciej Leciejewski s21484
+Benchmark of the fuzzy grading system - compares cost of grading single student and whole batches.
+
+How to run:
+- execute code with `python benchmark.py [students]`
+"""
+
+import sys
+import time
+import numpy
+from main import BatchFuzzyGrader, FuzzyGrader
+
+
+def random_students(count, seed=0):
+    """
+    Return random attendance, homework and final test scores (0-100) for given number of students
+    """
+    rng = numpy.random.default_rng(seed)
+    return rng.integers(0, 101, size=(3, count))
+
+
+def measure(name, grade, students):
+    """
+    Grade every student with given function and print time per student
+
+    Returns: time per student in seconds
+    """
+    start = time.perf_counter()
+    for attend, hw, test in zip(*students):
+        grade(attend, hw, test)
+    per_call = (time.perf_counter() - start) / students.shape[1]
+    print(f"{name}: {per_call * 1000:.3f} ms per student")
+    return per_call
+
+
+def benchmark_rebuild_vs_reuse(count):
+    """
+    Compare building control system for every student (old compute_fuzzy) with reused FuzzyGrader
+    """
+    students = random_students(count)
+    rebuild = measure("Rebuild per call", lambda a, h, t: FuzzyGrader().grade(a, h, t), students)
+    grader = FuzzyGrader()
+    reuse = measure("Reused FuzzyGrader", grader.grade, students)
+    print(f"Speedup: {rebuild / reuse:.1f}x")
+
+
+def benchmark_batch(count, batch_count=100000):
+    """
+    Compare reused FuzzyGrader with vectorized BatchFuzzyGrader, check both give the same grades
+    """
+    students = random_students(count)
+    grader = FuzzyGrader()
+    start = time.perf_counter()
+    expected = numpy.array([grader.grade(attend, hw, test) for attend, hw, test in zip(*students)])
+    per_call = (time.perf_counter() - start) / count
+
+    batch_grader = BatchFuzzyGrader()
+    difference = numpy.abs(batch_grader.grade(*students) - expected)
+    same_coverage = numpy.array_equal(numpy.isnan(difference), numpy.isnan(expected))
+    print(f"Batch max difference: {numpy.nanmax(difference):.2e}, same students without grade: {same_coverage}")
+
+    students = random_students(batch_count)
+    start = time.perf_counter()
+    batch_grader.grade(*students)
+    batch_time = time.perf_counter() - start
+    print(f"BatchFuzzyGrader: {batch_count} students in {batch_time:.3f} s "
+          f"({batch_time / batch_count * 1000:.5f} ms per student)")
+    print(f"Speedup: {per_call * batch_count / batch_time:.0f}x")
+
+
+if __name__ == '__main__':
+    students_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    benchmark_rebuild_vs_reuse(students_count)
+    benchmark_batch(students_count)
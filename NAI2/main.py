@@ -8,7 +8,13 @@ System requirements:
 - Numpy
 """
 
-import sys
+import argparse
+import collections
+import concurrent.futures
+import csv
+import itertools
+import os
+import time
 import matplotlib.pyplot as plt
 import numpy
 import skfuzzy
@@ -24,24 +30,21 @@ dop_parameter = [30, 40, 50, 60]
 dst_parameter = [40, 50, 60, 70]
 db_parameter = [50, 60, 70, 80]
 bdb_parameter = [65, 80, 100, 100]
+INPUT_LABELS = ['Attendance', 'Homeworks', 'Final test']
+OUTPUT_LABEL = 'Final grade'
+LABELS = [NDST, DOP, DST, DB, BDB]
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.csv')
+CSV_COLUMNS = ['attendance', 'homework', 'final_test']
+CSV_GRADE_COLUMN = 'final_grade'
 
-"""
-Parameters:
-    - attend (int): Attendance score (0-100)
-    - hw (int): Homework score (0-100)
-    - test (int): Final test score (0-100)
-"""
 
-
-def compute_fuzzy(attend, hw, test):
+def build_variables():
     """
-    Return the final grade based on attendance, homeworks and final test results.
     Define inputs (attendance, homeworks and final test) and outputs (final grade) for fuzzy logic
     Define membership functions (trapezoidal)
-    Define rules for fuzzy logic
-    Draws diagram for final grade
-    """
 
+    Returns: attendance, homeworks, final test antecedents and final grade consequent
+    """
     """ 
     Define membership functions for input and output variables
     input rules
@@ -77,74 +80,369 @@ def compute_fuzzy(attend, hw, test):
     final_grade[DB] = skfuzzy.trapmf(final_grade.universe, db_parameter)
     final_grade[BDB] = skfuzzy.trapmf(final_grade.universe, bdb_parameter)
 
-    """Define fuzzy rules"""
-    rule1 = skfuzzy.control.Rule(attendance[NDST] & final_test[NDST] & homeworks[NDST], final_grade[NDST])
-    rule2 = skfuzzy.control.Rule(attendance[NDST] & final_test[DOP] & homeworks[NDST], final_grade[NDST])
-    rule3 = skfuzzy.control.Rule(attendance[NDST] & final_test[DST] & homeworks[NDST], final_grade[DOP])
-    rule4 = skfuzzy.control.Rule(attendance[NDST] & final_test[DB] & homeworks[NDST], final_grade[DOP])
-    rule5 = skfuzzy.control.Rule(attendance[NDST] & final_test[DST] & homeworks[DB], final_grade[DST])
-    rule6 = skfuzzy.control.Rule(attendance[NDST] & final_test[NDST] & homeworks[DOP], final_grade[NDST])
-    rule7 = skfuzzy.control.Rule(attendance[NDST] & final_test[DOP] & homeworks[DOP], final_grade[DOP])
-    rule8 = skfuzzy.control.Rule(attendance[NDST] & final_test[DST] & homeworks[DOP], final_grade[DOP])
-    rule9 = skfuzzy.control.Rule((attendance[NDST] & final_test[DST] & homeworks[DST]), final_grade[DST])
-    rule10 = skfuzzy.control.Rule(attendance[NDST] & final_test[BDB] & homeworks[DST], final_grade[DB])
-    rule11 = skfuzzy.control.Rule(attendance[DOP] & final_test[DOP] & homeworks[DST], final_grade[DOP])
-    rule12 = skfuzzy.control.Rule(attendance[DOP] & final_test[DST] & homeworks[DST], final_grade[DST])
-    rule13 = skfuzzy.control.Rule(attendance[DOP] & final_test[DB] & homeworks[DST], final_grade[DST])
-    rule14 = skfuzzy.control.Rule(attendance[DOP] & final_test[DB] & homeworks[DB], final_grade[DB])
-    rule15 = skfuzzy.control.Rule(attendance[DOP] & final_test[DOP] & homeworks[BDB], final_grade[DST])
-    rule16 = skfuzzy.control.Rule(attendance[DOP] & final_test[DOP] & homeworks[DOP], final_grade[DOP])
-    rule17 = skfuzzy.control.Rule(attendance[DOP] & final_test[NDST] & homeworks[NDST], final_grade[NDST])
-    rule18 = skfuzzy.control.Rule(attendance[DOP] & final_test[NDST] & homeworks[DST], final_grade[DOP])
-    rule19 = skfuzzy.control.Rule(attendance[DST] & final_test[DOP] & homeworks[DOP], final_grade[DOP])
-    rule20 = skfuzzy.control.Rule(attendance[DST] & final_test[BDB] & homeworks[BDB], final_grade[DB])
-    rule21 = skfuzzy.control.Rule(attendance[DST] & final_test[DST] & homeworks[DOP], final_grade[DST])
-    rule22 = skfuzzy.control.Rule(attendance[DST] & final_test[NDST] & homeworks[NDST], final_grade[NDST])
-    rule23 = skfuzzy.control.Rule(attendance[DB] & final_test[BDB] & homeworks[DB], final_grade[DB])
-    rule24 = skfuzzy.control.Rule(attendance[DB] & final_test[DB] & homeworks[DB], final_grade[DB])
-    rule25 = skfuzzy.control.Rule(attendance[DB] & final_test[NDST] & homeworks[NDST], final_grade[NDST])
-    rule26 = skfuzzy.control.Rule(attendance[DB] & final_test[DST] & homeworks[DB], final_grade[DB])
-    rule27 = skfuzzy.control.Rule(attendance[DB] & final_test[BDB] & homeworks[BDB], final_grade[BDB])
-    rule28 = skfuzzy.control.Rule(attendance[BDB] & final_test[BDB] & homeworks[DB], final_grade[DB])
-    rule29 = skfuzzy.control.Rule(attendance[BDB] & final_test[DOP] & homeworks[DOP], final_grade[DB])
-    rule30 = skfuzzy.control.Rule(attendance[BDB] & final_test[DOP] & homeworks[DB], final_grade[DST])
-    rule31 = skfuzzy.control.Rule(attendance[BDB] & final_test[DOP] & homeworks[DST], final_grade[DST])
-    rule32 = skfuzzy.control.Rule(attendance[BDB] & final_test[NDST] & homeworks[NDST], final_grade[NDST])
-    rule33 = skfuzzy.control.Rule(attendance[BDB] & final_test[DOP] & homeworks[NDST],final_grade[DOP])
-    rule34 = skfuzzy.control.Rule(attendance[BDB] & final_test[NDST] & homeworks[DOP], final_grade[NDST])
-    rule35 = skfuzzy.control.Rule(attendance[BDB] & final_test[DST] & homeworks[NDST], final_grade[DST])
-    rule36 = skfuzzy.control.Rule(attendance[BDB] & final_test[NDST] & homeworks[DST], final_grade[DOP])
-    rule37 = skfuzzy.control.Rule(attendance[BDB] & final_test[DB] & homeworks[NDST], final_grade[DB])
-    rule38 = skfuzzy.control.Rule(attendance[BDB] & final_test[NDST] & homeworks[DB], final_grade[DOP])
-    rule39 = skfuzzy.control.Rule(attendance[BDB] & final_test[NDST] & homeworks[BDB], final_grade[DST])
-    rule40 = skfuzzy.control.Rule(attendance[BDB] & final_test[DOP] & homeworks[BDB], final_grade[DB])
-    rule41 = skfuzzy.control.Rule(attendance[BDB] & final_test[DST] & homeworks[BDB], final_grade[DB])
-    rule42 = skfuzzy.control.Rule(attendance[BDB] & final_test[DB] & homeworks[BDB], final_grade[DB])
-    rule43 = skfuzzy.control.Rule(attendance[BDB] & final_test[BDB] & homeworks[BDB], final_grade[BDB])
-
-    """Control system setup"""
-    rule_list = [rule1, rule2, rule3, rule4, rule5, rule6, rule7, rule8, rule9, rule10, rule11, rule12, rule13, rule14,
-                 rule15, rule16, rule17, rule18, rule19, rule20, rule21, rule22, rule23, rule24, rule25, rule26, rule27,
-                 rule28, rule29, rule30, rule31, rule32, rule33, rule34, rule35, rule36, rule37, rule38, rule39, rule40,
-                 rule41, rule42, rule43]
-
-    performance_ctrl = skfuzzy.control.ControlSystem(rule_list)
-    perf_analysis = skfuzzy.control.ControlSystemSimulation(performance_ctrl)
-
-    """Set input values and compute the output"""
-    perf_analysis.input['Attendance'] = attend
-    perf_analysis.input['Final test'] = test
-    perf_analysis.input['Homeworks'] = hw
-
-    perf_analysis.compute()
-
-    """Display the output using Matplotlib"""
-    final_grade.view(sim=perf_analysis)
-    plt.show()
+    return attendance, homeworks, final_test, final_grade
+
+
+def load_rules(rules_file=RULES_FILE):
+    """
+    Load fuzzy rules from csv file with attendance, homeworks, final test and final grade labels in every row
+
+    Returns: rule matrix (rules x 4) of label indexes in LABELS
+    """
+    with open(rules_file, newline='', encoding='UTF8') as f:
+        rows = list(csv.DictReader(f))
+    return numpy.array([[LABELS.index(row[label]) for label in INPUT_LABELS + [OUTPUT_LABEL]] for row in rows],
+                       dtype=numpy.intp).reshape(-1, len(INPUT_LABELS) + 1)
+
+
+def build_control_system(rules_file=RULES_FILE):
+    """
+    Define variables with build_variables() and fuzzy rules loaded from rules_file
+
+    Returns: control system and final grade consequent (needed for drawing diagram)
+    """
+    attendance, homeworks, final_test, final_grade = build_variables()
+    rule_list = [skfuzzy.control.Rule(attendance[LABELS[a]] & final_test[LABELS[t]] & homeworks[LABELS[h]],
+                                      final_grade[LABELS[g]])
+                 for a, h, t, g in load_rules(rules_file)]
+
+    return skfuzzy.control.ControlSystem(rule_list), final_grade
+
+
+class FuzzyGrader:
+    """
+    Fuzzy control system which is built only once and reused for grading every student
+    """
+
+    def __init__(self, rules_file=RULES_FILE):
+        self.control_system, self.final_grade = build_control_system(rules_file)
+        self.simulation = skfuzzy.control.ControlSystemSimulation(self.control_system)
+
+    def grade(self, attend, hw, test, plot=False):
+        """
+        Return the final grade based on attendance, homeworks and final test results.
+
+        Parameters:
+            - attend (int): Attendance score (0-100)
+            - hw (int): Homework score (0-100)
+            - test (int): Final test score (0-100)
+            - plot (bool): Draws diagram for final grade
+
+        Returns: final grade (float), nan when no rule covers given scores
+        """
+        """Set input values and compute the output"""
+        self.simulation.input['Attendance'] = attend
+        self.simulation.input['Homeworks'] = hw
+        self.simulation.input['Final test'] = test
+
+        """Output of previous student is not removed by skfuzzy when no rule fires"""
+        self.simulation.output.clear()
+        self.simulation.compute()
+
+        if plot:
+            """Display the output using Matplotlib"""
+            self.final_grade.view(sim=self.simulation)
+            plt.show()
+
+        return float(self.simulation.output.get(OUTPUT_LABEL, numpy.nan))
+
+
+class BatchFuzzyGrader:
+    """
+    Vectorized version of FuzzyGrader - grades whole arrays of students in one NumPy pass.
+    Follows skfuzzy Mamdani inference: min for AND, max accumulation, centroid defuzzification
+    """
+
+    def __init__(self, rules_file=RULES_FILE, chunk_size=8192):
+        """
+        Parameters:
+            - rules_file (str): csv file with fuzzy rules, see load_rules()
+            - chunk_size (int): number of students evaluated at once, limits memory used by temporary arrays
+        """
+        self.chunk_size = chunk_size
+        attendance, homeworks, final_test, final_grade = build_variables()
+
+        """Membership functions sampled on universe: (inputs x labels x universe) and (labels x universe)"""
+        self.input_universe = attendance.universe.astype(float)
+        self.input_mfs = numpy.array([[variable[label].mf for label in LABELS]
+                                      for variable in (attendance, homeworks, final_test)], dtype=float)
+        self.universe = final_grade.universe.astype(float)
+        self.output_mfs = numpy.array([final_grade[label].mf for label in LABELS], dtype=float)
+        self.sloped_segments = numpy.nonzero(numpy.diff(self.output_mfs, axis=1))
+
+        """Rule matrix: label indexes of every input (rules x inputs) and of output"""
+        rules = load_rules(rules_file)
+        self.rule_inputs = rules[:, :len(INPUT_LABELS)]
+        self.rule_outputs = rules[:, len(INPUT_LABELS)]
+
+    def grade(self, attend, hw, test):
+        """
+        Return final grades based on attendance, homeworks and final test results.
+
+        Parameters:
+            - attend (array): Attendance scores (0-100)
+            - hw (array): Homework scores (0-100)
+            - test (array): Final test scores (0-100)
+
+        Returns: array of final grades, nan where no rule covers given scores
+        """
+        scores = numpy.column_stack(numpy.broadcast_arrays(attend, hw, test)).astype(float)
+        grades = numpy.empty(len(scores))
+        for start in range(0, len(scores), self.chunk_size):
+            grades[start:start + self.chunk_size] = self._grade_chunk(scores[start:start + self.chunk_size])
+        return grades
+
+    def _grade_chunk(self, scores):
+        """
+        Grade students from (students, 3) array of attendance, homework and final test scores
+        """
+        """Fuzzify inputs (inputs x labels x students)"""
+        values = numpy.clip(scores, self.input_universe[0], self.input_universe[-1])
+        memberships = numpy.array([[numpy.interp(values[:, i], self.input_universe, mf) for mf in mfs]
+                                   for i, mfs in enumerate(self.input_mfs)])
+
+        """Fire all rules at once: gather memberships of rule labels (rules x inputs x students), AND = min"""
+        firing = memberships[numpy.arange(len(INPUT_LABELS)), self.rule_inputs].min(axis=1).T
+
+        """Accumulate rules firing the same output term (max)"""
+        cuts = numpy.zeros((len(scores), len(LABELS)))
+        for k in range(len(LABELS)):
+            rules = self.rule_outputs == k
+            if rules.any():
+                cuts[:, k] = firing[:, rules].max(axis=1)
+
+        """Add points where every output term crosses its cut, the same as skfuzzy does before defuzzification.
+        Only sloped segments of membership functions can be crossed"""
+        universe = self.universe
+        terms, segments = self.sloped_segments
+        y1 = self.output_mfs[terms, segments]
+        y2 = self.output_mfs[terms, segments + 1]
+        term_cuts = cuts[:, terms]
+        crossing = (y1 >= term_cuts) != (y2 >= term_cuts)
+        crossings = universe[segments] + (term_cuts - y1) * (universe[segments + 1] - universe[segments]) / (y2 - y1)
+        points = numpy.concatenate([numpy.broadcast_to(universe, (len(scores), len(universe))),
+                                    numpy.where(crossing, crossings, universe[segments])], axis=1)
+        points.sort(axis=1)
+
+        """Output membership function: max of output terms clipped at their cuts"""
+        output_mf = numpy.zeros_like(points)
+        for k, mf in enumerate(self.output_mfs):
+            numpy.maximum(output_mf, numpy.minimum(numpy.interp(points, universe, mf), cuts[:, k, None]), out=output_mf)
+
+        """Centroid of piecewise linear membership function"""
+        x1, x2 = points[:, :-1], points[:, 1:]
+        y1, y2 = output_mf[:, :-1], output_mf[:, 1:]
+        area = ((x2 - x1) * (y1 + y2) / 2).sum(axis=1)
+        moment = ((x2 - x1) * (x1 * (2 * y1 + y2) + x2 * (y1 + 2 * y2)) / 6).sum(axis=1)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(area > 0, moment / area, numpy.nan)
+
+
+class LookupTableGrader:
+    """
+    Grades students from precomputed table of the fuzzy grading surface using trilinear interpolation.
+    Table is memory-mapped, so loading it takes constant time regardless of its size
+    """
+
+    def __init__(self, table_file):
+        """
+        Parameters:
+            - table_file (str): path to .npy table created with build_lookup_table()
+        """
+        self.table = numpy.load(table_file, mmap_mode='r')
+        self.step = 100 / (self.table.shape[0] - 1)
+
+    def grade(self, attend, hw, test):
+        """
+        Return final grades based on attendance, homeworks and final test results.
+
+        Parameters:
+            - attend (int or array): Attendance score (0-100)
+            - hw (int or array): Homework score (0-100)
+            - test (int or array): Final test score (0-100)
+
+        Returns: final grade (array), nan where no rule covers the surrounding grid points
+        """
+        position = numpy.clip(numpy.stack(numpy.broadcast_arrays(attend, hw, test)).astype(float), 0, 100) / self.step
+        index = numpy.minimum(position.astype(numpy.intp), self.table.shape[0] - 2)
+        fraction = position - index
+
+        """Weighted sum of 8 surrounding grid points, points with zero weight are skipped (they can be nan)"""
+        grades = numpy.zeros(position.shape[1:])
+        for corner in itertools.product((0, 1), repeat=3):
+            weight = numpy.prod([fraction[i] if c else 1 - fraction[i] for i, c in enumerate(corner)], axis=0)
+            values = self.table[index[0] + corner[0], index[1] + corner[1], index[2] + corner[2]]
+            grades += numpy.where(weight > 0, weight * values, 0)
+        return grades
+
+    def max_error(self, grader=None, samples=100000, seed=0):
+        """
+        Compare table with exact grading engine on random scores
+
+        Parameters:
+            - grader: exact grader, BatchFuzzyGrader by default
+            - samples (int): number of random students
+            - seed (int): random generator seed
+
+        Returns: maximum absolute error and fraction of students graded by only one of the graders
+        """
+        grader = grader or BatchFuzzyGrader()
+        scores = numpy.random.default_rng(seed).uniform(0, 100, size=(3, samples))
+        expected = grader.grade(*scores)
+        grades = self.grade(*scores)
+        covered = ~numpy.isnan(expected) & ~numpy.isnan(grades)
+        mismatched = numpy.isnan(expected) != numpy.isnan(grades)
+        return float(numpy.abs(grades - expected)[covered].max(initial=0)), float(mismatched.mean())
+
+
+def build_lookup_table(table_file, step=1.0, grader=None):
+    """
+    Evaluate fuzzy grading system on a grid of attendance, homework and final test scores and save it as .npy table
+
+    Parameters:
+        - table_file (str): path of created table
+        - step (float): distance between grid points, should divide 100
+        - grader: exact grader, BatchFuzzyGrader by default
+
+    Returns: LookupTableGrader using created table
+    """
+    grader = grader or BatchFuzzyGrader()
+    axis = numpy.linspace(0, 100, int(round(100 / step)) + 1)
+    grid = numpy.meshgrid(axis, axis, axis, indexing='ij')
+    table = grader.grade(*(scores.ravel() for scores in grid)).reshape(grid[0].shape)
+    numpy.save(table_file, table.astype(numpy.float32))
+    return LookupTableGrader(table_file)
+
+
+def read_chunks(reader, chunk_size):
+    """
+    Yield lists of at most chunk_size rows from csv reader
+    """
+    while True:
+        chunk = list(itertools.islice(reader, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_worker_grader = None
+
+
+def _grade_rows(rows, columns):
+    """
+    Grade csv rows, columns are indexes of attendance, homework and final test values.
+    BatchFuzzyGrader is built once per process
+    """
+    global _worker_grader
+    if _worker_grader is None:
+        _worker_grader = BatchFuzzyGrader()
+    scores = numpy.array([[row[i] for i in columns] for row in rows], dtype=float).reshape(-1, len(columns))
+    return _worker_grader.grade(*scores.T)
+
+
+def grade_csv(input_file, output_file, chunk_size=10000, workers=None):
+    """
+    Grade every student from csv file and write rows with added final grade column to output csv file.
+    Input is read and output is written chunk by chunk, chunks are graded in parallel processes
+
+    Parameters:
+        - input_file (str): csv file with header containing attendance, homework and final_test columns
+        - output_file (str): created csv file
+        - chunk_size (int): number of rows graded at once
+        - workers (int): number of processes, all cores by default, 1 grades in this process
+
+    Returns: number of graded rows
+    """
+    workers = workers or os.cpu_count()
+    rows_count = 0
+    with open(input_file, newline='', encoding='UTF8') as f_in, \
+            open(output_file, 'w', newline='', encoding='UTF8') as f_out:
+        reader = csv.reader(f_in)
+        writer = csv.writer(f_out)
+        header = next(reader)
+        columns = [header.index(column) for column in CSV_COLUMNS]
+        writer.writerow(header + [CSV_GRADE_COLUMN])
+
+        def write(rows, grades):
+            writer.writerows(row + ['' if numpy.isnan(grade) else f'{grade:.2f}'] for row, grade in zip(rows, grades))
+            return len(rows)
+
+        if workers == 1:
+            for rows in read_chunks(reader, chunk_size):
+                rows_count += write(rows, _grade_rows(rows, columns))
+            return rows_count
+
+        """Only a few chunks per worker are kept in memory, results are written in input order"""
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pending = collections.deque()
+            for rows in read_chunks(reader, chunk_size):
+                pending.append((rows, executor.submit(_grade_rows, rows, columns)))
+                if len(pending) >= 2 * workers:
+                    rows, future = pending.popleft()
+                    rows_count += write(rows, future.result())
+            while pending:
+                rows, future = pending.popleft()
+                rows_count += write(rows, future.result())
+    return rows_count
+
+
+def compute_fuzzy(attend, hw, test, plot=True):
+    """
+    Return the final grade based on attendance, homeworks and final test results.
+    Builds new fuzzy grader, so use FuzzyGrader directly when grading many students
+    Draws diagram for final grade
+    """
+    return FuzzyGrader().grade(attend, hw, test, plot=plot)
+
+
+def compute_fuzzy_batch(attend, hw, test):
+    """
+    Return final grades for arrays of attendance, homeworks and final test results.
+    Evaluated with vectorized BatchFuzzyGrader, without drawing diagrams
+    """
+    return BatchFuzzyGrader().grade(attend, hw, test)
+
+
+def build_arg_parser():
+    """
+    Enables to input scores, csv files and lookup table options
+
+    :return: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Compute final grade')
+    parser.add_argument('scores', type=int, nargs='*', metavar='score',
+                        help='Attendance, homework and final test scores (0-100)')
+    parser.add_argument('--build-table', dest='build_table', metavar='TABLE',
+                        help='Precompute grades on a grid and save them as .npy table')
+    parser.add_argument('--step', type=float, default=1.0, help='Grid step of built table')
+    parser.add_argument('--table', dest='table', metavar='TABLE', help='Grade using precomputed .npy table')
+    parser.add_argument('--input', dest='input', help='Csv file with attendance, homework and final_test columns')
+    parser.add_argument('--output', dest='output', help='Csv file for graded rows')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=10000, help='Rows graded at once')
+    parser.add_argument('--workers', type=int, default=None, help='Number of grading processes (default: all cores)')
+
+    return parser
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
+    parser = build_arg_parser()
+    args = parser.parse_args()
+
+    if args.input or args.output:
+        if not (args.input and args.output):
+            parser.error('--input and --output must be used together')
+        start = time.perf_counter()
+        rows_count = grade_csv(args.input, args.output, args.chunk_size, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"Graded {rows_count} rows in {elapsed:.2f} s ({rows_count / elapsed:.0f} rows/s)")
+    elif args.build_table:
+        lookup_table = build_lookup_table(args.build_table, args.step)
+        error, mismatched = lookup_table.max_error()
+        print(f"Table {lookup_table.table.shape} saved to {args.build_table}")
+        print(f"Maximum error: {error:.4f}, students graded by only one engine: {mismatched:.2%}")
+    elif len(args.scores) != 3:
         print("Usage: python main.py <attendance> <homework> <final_test>")
+    elif args.table:
+        print("Final grade:", float(LookupTableGrader(args.table).grade(*args.scores)))
     else:
-        compute_fuzzy(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))
\ No newline at end of file
+        print("Final grade:", compute_fuzzy(*args.scores))
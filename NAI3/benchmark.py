@@ -0,0 +1,110 @@
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Benchmarks of the movie recommender on synthetic ratings: top-k selection and approximate user matching.
+
+How to run:
+- execute code with `python benchmark.py [users] [movies] [ratings_per_user]`
+"""
+
+import sys
+import time
+import numpy as np
+from main import METRICS, LSHIndex, RatingsMatrix, select_movies, top_k
+
+
+def synthetic_matrix(users, items, ratings_per_user, clusters=50, seed=0):
+    """
+    Create ratings of users with similar tastes inside clusters
+
+    :param: users: number of users
+    :param: items: number of movies
+    :param: ratings_per_user: number of movies rated by every user
+    :param: clusters: number of taste groups
+    :param: seed: random generator seed
+
+    :return: RatingsMatrix
+    """
+    rng = np.random.default_rng(seed)
+    tastes = rng.uniform(1, 10, size=(clusters, items))
+    user_clusters = rng.integers(0, clusters, users)
+    """Most movies come from a pool watched by the user's group, the rest are popular movies"""
+    pools = rng.integers(0, items, size=(clusters, 10 * ratings_per_user))
+    popularity = 1 / np.arange(1, items + 1)
+    user_ids = np.repeat(np.arange(users), ratings_per_user)
+    item_ids = np.where(rng.random(len(user_ids)) < 0.7,
+                        pools[user_clusters[user_ids], rng.integers(0, pools.shape[1], len(user_ids))],
+                        rng.choice(items, len(user_ids), p=popularity / popularity.sum()))
+    ratings = np.clip(np.rint(tastes[user_clusters[user_ids], item_ids] + rng.normal(0, 1, len(item_ids))), 1, 10)
+    return RatingsMatrix([f'user {i}' for i in range(users)], [f'movie {i}' for i in range(items)],
+                         user_ids, item_ids, ratings)
+
+
+def benchmark_ann_recall(matrix, k=10, queries=100, metric='euclidean', tables=8, bits=None, probes=2, seed=0):
+    """
+    Compare LSHIndex with exact search: recall@k and query time.
+    Returned user counts as hit when its exact score is not lower than exact k-th best score (ties)
+    """
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    index = LSHIndex(matrix, metric, tables, bits, probes)
+    print(f"LSH index ({index.tables} tables x {index.bits} bits, {probes} probes) "
+          f"built in {time.perf_counter() - start:.2f} s")
+
+    exact_time = ann_time = 0
+    hits = 0
+    for row in rng.choice(len(matrix.users), size=queries, replace=False):
+        user = matrix.users[row]
+        start = time.perf_counter()
+        scores = matrix.scores(user, metric)
+        scores[row] = -np.inf
+        best = top_k(scores[None, :], k)[0]
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        matches = index.matches(user, k)
+        ann_time += time.perf_counter() - start
+        hits += sum(scores[matrix.user_index[name]] >= scores[best[-1]] for name, _ in matches)
+
+    print(f"{metric} recall@{k}: {hits / (queries * k):.3f}")
+    print(f"Exact: {exact_time / queries * 1000:.2f} ms per query, LSH: {ann_time / queries * 1000:.2f} ms per query")
+
+
+def benchmark_top_k(users=1000000, movies=1000000, k=5, seed=0):
+    """
+    Compare full sorts (previous pipeline) with top-k selection for matching users and choosing movies
+    """
+    rng = np.random.default_rng(seed)
+    scores = rng.random(users)
+    names = [f'user {i}' for i in range(users)]
+    catalogue = dict(zip((f'movie {i}' for i in range(movies)), rng.integers(1, 11, movies).tolist()))
+    seen = dict(list(catalogue.items())[:movies // 10])
+
+    def measure(name, function):
+        start = time.perf_counter()
+        result = function()
+        print(f"{name}: {(time.perf_counter() - start) * 1000:.1f} ms")
+        return result
+
+    print(f"Top {k} of {users} users and {movies} movies")
+    sorted_users = measure("Users full sort", lambda: sorted(dict(zip(names, scores)).items(),
+                                                            key=lambda x: x[1], reverse=True)[:k])
+    selected_users = measure("Users top_k", lambda: [names[i] for i in top_k(scores[None, :], k)[0]])
+    sorted_movies = measure("Movies full sort", lambda: [movie for movie in sorted(catalogue.items(),
+                                                                                 key=lambda x: x[1], reverse=True)
+                                                         if movie[0] not in seen][:k])
+    selected_movies = measure("Movies heap", lambda: list(select_movies(catalogue, seen, k)))
+    print(f"Same results: {[name for name, _ in sorted_users] == selected_users and sorted_movies == selected_movies}")
+
+
+if __name__ == '__main__':
+    users_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    items_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    per_user = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+    benchmark_top_k()
+    ratings_matrix = synthetic_matrix(users_count, items_count, per_user)
+    print(f"{users_count} users, {items_count} movies, {ratings_matrix.ratings.nnz} ratings")
+    for similarity in METRICS:
+        for lsh_tables, lsh_bits, lsh_probes in ((8, None, 2), (16, 8, 2), (32, 8, 4)):
+            benchmark_ann_recall(ratings_matrix, metric=similarity, tables=lsh_tables, bits=lsh_bits,
+                                 probes=lsh_probes)
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+import numpy as np
+
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Load test of the recommender server: concurrent clients with keep-alive connections send recommended and
+not recommended queries (and optionally rating updates), then p50/p99 latency and queries per second are reported.
+
+How to run:
+- start the server with `python server.py`
+- execute `python load_test.py [--clients 16] [--requests 200] [--updates 0.05]`
+"""
+
+
+async def request(reader, writer, method, target, body=None):
+    """
+    Send HTTP/1.1 request over open connection
+
+    :return: status and decoded JSON payload
+    """
+    data = json.dumps(body).encode('UTF8') if body is not None else b''
+    writer.write(f'{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    payload = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, json.loads(payload)
+
+
+async def client(host, port, users, movies, requests, updates, seed, latencies, errors):
+    """
+    Send requests one after another over one connection and record latency of every request
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            user = rng.choice(users)
+            start = time.perf_counter()
+            if rng.random() < updates:
+                status, _ = await request(reader, writer, 'POST', '/ratings',
+                                          {'user': user, 'movie': rng.choice(movies), 'rating': rng.randint(1, 10)})
+            else:
+                path = rng.choice(('/recommended', '/not_recommended'))
+                status, _ = await request(reader, writer, 'GET', f'{path}?{urllib.parse.urlencode({"user": user})}')
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(host, port, clients, requests, updates):
+    """
+    Run concurrent clients and print latency percentiles and throughput
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    _, payload = await request(reader, writer, 'GET', '/users?limit=100000')
+    users = payload['users']
+    _, payload = await request(reader, writer, 'GET', f'/recommended?{urllib.parse.urlencode({"user": users[0]})}')
+    movies = [movie['movie'] for movie in payload['movies']] or ['Load test movie']
+    writer.close()
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, users, movies, requests, updates, seed, latencies, errors)
+                           for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    print(f"{len(latencies)} requests from {clients} clients in {elapsed:.2f} s, {len(errors)} errors")
+    print(f"p50: {p50:.2f} ms, p99: {p99:.2f} ms, {len(latencies) / elapsed:.0f} queries/s")
+
+
+def build_arg_parser():
+    """
+    Enables to input load test options
+
+    :return: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Load test of recommender server')
+    parser.add_argument('--host', default='127.0.0.1', help='Server host')
+    parser.add_argument('--port', type=int, default=8000, help='Server port')
+    parser.add_argument('--clients', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests sent by every client')
+    parser.add_argument('--updates', type=float, default=0.0, help='Fraction of requests changing ratings')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    asyncio.run(run(args.host, args.port, args.clients, args.requests, args.updates))
@@ -1,6 +1,9 @@
 import argparse
+import heapq
 import json
+import os
 import numpy as np
+from scipy import sparse
 
 """
 Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
@@ -8,6 +11,7 @@ Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
 System requirements:
 - Python 3.9
 - numpy
+- scipy
 
 How to run:
 - enter '--user "name last_name"' in Run/Debug Configuration parameters
@@ -17,12 +21,20 @@ How to run:
 
 def build_arg_parser():
     """
-    Enables to input user
+    Enables to input user, ratings store and similarity index options
 
     :return: argument parser
     """
     parser = argparse.ArgumentParser(description='Compute similarity score')
-    parser.add_argument('--user', dest='user', required=True, help='User')
+    parser.add_argument('--user', dest='user', help='User')
+    parser.add_argument('--build-index', dest='build_index', metavar='INDEX',
+                        help='Precompute most similar users of every user and save them to .npz file')
+    parser.add_argument('--k', type=int, default=10, help='Number of neighbours stored in built index')
+    parser.add_argument('--metric', choices=METRICS, default='euclidean', help='Similarity metric of built index')
+    parser.add_argument('--index', dest='index', metavar='INDEX', help='Use precomputed index of similar users')
+    parser.add_argument('--ann', action='store_true', help='Find similar users approximately with LSH')
+    parser.add_argument('--convert', metavar='STORE', help='Convert ratings.json into memory-mapped binary store')
+    parser.add_argument('--store', metavar='STORE', help='Load ratings from binary store instead of ratings.json')
 
     return parser
 
@@ -52,6 +64,495 @@ def euclidean_score(dataset, user1, user2):
     return 1 / (1 + np.sqrt(np.sum(squared_diff)))
 
 
+METRICS = ('euclidean', 'pearson', 'cosine')
+BLOCK_ELEMENTS = 2 ** 22
+STORE_ARRAYS = ('indptr', 'movie_ids', 'ratings', 'sequence', 'squared', 'rated', 'norms',
+                'users', 'users_order', 'movies', 'movies_order')
+
+
+class NameTable:
+    """
+    Read-only map of names to indexes using binary search over sorted order of names,
+    so names loaded from memory-mapped store do not have to be put into a dict
+    """
+
+    def __init__(self, names, order):
+        """
+        :param: names: array of names
+        :param: order: indexes which sort names
+        """
+        self.names = names
+        self.order = order
+
+    def _find(self, name):
+        position = np.searchsorted(self.names, name, sorter=self.order)
+        if position < len(self.order) and self.names[self.order[position]] == name:
+            return int(self.order[position])
+        return None
+
+    def __getitem__(self, name):
+        index = self._find(name)
+        if index is None:
+            raise KeyError(name)
+        return index
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+
+class RatingsMatrix:
+    """
+    Sparse CSR user x item matrix of ratings with maps between names and row/column indexes
+    """
+
+    def __init__(self, users, items, user_ids, item_ids, ratings):
+        """
+        :param: users: names of users (rows)
+        :param: items: names of movies (columns)
+        :param: user_ids: row index of every rating
+        :param: item_ids: column index of every rating
+        :param: ratings: rating values
+        """
+        self.users = list(users)
+        self.items = list(items)
+        self.user_index = {user: i for i, user in enumerate(self.users)}
+        self.item_index = {item: i for i, item in enumerate(self.items)}
+        shape = (len(self.users), len(self.items))
+        self.ratings = sparse.csr_matrix((np.asarray(ratings, dtype=np.float64), (user_ids, item_ids)), shape=shape)
+        self.ratings.sum_duplicates()
+        """Position of every rating in input, CSR keeps movies of user sorted by column instead of rating order"""
+        self.sequence = sparse.csr_matrix((np.arange(1, len(user_ids) + 1), (user_ids, item_ids)),
+                                          shape=shape)
+        self.sequence.sum_duplicates()
+        self._derive()
+
+    def _derive(self):
+        """
+        Compute matrices derived from ratings (kept in memory-mapped store as well)
+        """
+        """Rated/not rated pattern, kept separately so zero ratings are not lost"""
+        self.rated = sparse.csr_matrix((np.ones_like(self.ratings.data), self.ratings.indices, self.ratings.indptr),
+                                       shape=self.ratings.shape)
+        self.squared = self.ratings.multiply(self.ratings).tocsr()
+        self.norms = np.sqrt(np.asarray(self.squared.sum(axis=1)).ravel())
+
+    @classmethod
+    def from_dict(cls, dataset):
+        """
+        Build matrix from dataset loaded from ratings.json
+
+        :param: dataset: contains users, movies and ratings
+        """
+        items = {}
+        user_ids, item_ids, ratings = [], [], []
+        for user_id, user_ratings in enumerate(dataset.values()):
+            for item, rating in user_ratings.items():
+                user_ids.append(user_id)
+                item_ids.append(items.setdefault(item, len(items)))
+                ratings.append(rating)
+        return cls(dataset.keys(), items.keys(), user_ids, item_ids, ratings)
+
+    def save(self, store_dir):
+        """
+        Convert matrix into columnar binary store: CSR row pointer (user ids), movie ids, ratings and derived
+        columns as .npy arrays, plus users and movies string tables with their sorted order
+
+        :param: store_dir: directory of created store
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        ratings = self.ratings.copy()
+        ratings.sort_indices()
+        sequence = self.sequence.copy()
+        sequence.sort_indices()
+        index_dtype = np.int32 if max(ratings.nnz, len(self.items)) < 2 ** 31 else np.int64
+        users = np.array(self.users, dtype=str)
+        movies = np.array(self.items, dtype=str)
+        arrays = {
+            'indptr': ratings.indptr.astype(index_dtype),
+            'movie_ids': ratings.indices.astype(index_dtype),
+            'ratings': ratings.data.astype(np.float32),
+            'sequence': np.argsort(np.argsort(sequence.data, kind='stable')).astype(index_dtype),
+            'squared': np.square(ratings.data).astype(np.float32),
+            'rated': np.ones(ratings.nnz, dtype=np.float32),
+            'norms': self.norms.astype(np.float32),
+            'users': users,
+            'users_order': np.argsort(users, kind='stable'),
+            'movies': movies,
+            'movies_order': np.argsort(movies, kind='stable'),
+        }
+        for name in STORE_ARRAYS:
+            np.save(os.path.join(store_dir, name + '.npy'), arrays[name])
+
+    @classmethod
+    def load(cls, store_dir):
+        """
+        Memory-map matrix from store created with save(). Nothing is parsed or copied, so loading takes
+        the same short time for any number of ratings and pages are shared between processes
+
+        :param: store_dir: directory of the store
+        """
+        arrays = {name: np.load(os.path.join(store_dir, name + '.npy'), mmap_mode='r') for name in STORE_ARRAYS}
+        matrix = cls.__new__(cls)
+        matrix.users = arrays['users']
+        matrix.items = arrays['movies']
+        matrix.user_index = NameTable(arrays['users'], arrays['users_order'])
+        matrix.item_index = NameTable(arrays['movies'], arrays['movies_order'])
+        shape = (len(matrix.users), len(matrix.items))
+        structure = (arrays['movie_ids'], arrays['indptr'])
+        matrix.ratings = sparse.csr_matrix((arrays['ratings'],) + structure, shape=shape, copy=False)
+        matrix.sequence = sparse.csr_matrix((arrays['sequence'],) + structure, shape=shape, copy=False)
+        matrix.squared = sparse.csr_matrix((arrays['squared'],) + structure, shape=shape, copy=False)
+        matrix.rated = sparse.csr_matrix((arrays['rated'],) + structure, shape=shape, copy=False)
+        matrix.norms = arrays['norms']
+        return matrix
+
+    def user_ratings(self, user):
+        """
+        Get ratings of user
+
+        :param: user: name of user
+
+        :return: dict of movies and ratings in order the user rated them, whole ratings are returned as int
+                 like in ratings.json
+        """
+        row = self.user_index[user]
+        ratings = self.ratings[row]
+        order = np.argsort(self.sequence[row].data, kind='stable')
+        return {str(self.items[item]): int(rating) if rating.is_integer() else rating
+                for item, rating in zip(ratings.indices[order], ratings.data[order].tolist())}
+
+    def set_rating(self, user, item, rating):
+        """
+        Add or change a single rating, new users and movies are appended
+
+        :param: user: name of user
+        :param: item: name of movie
+        :param: rating: new rating
+
+        :return: row index of user and column index of movie
+        """
+        if isinstance(self.user_index, NameTable):
+            """Names loaded from store are read-only, copy them into list and dict"""
+            self.users = [str(name) for name in self.users]
+            self.items = [str(name) for name in self.items]
+            self.user_index = {name: i for i, name in enumerate(self.users)}
+            self.item_index = {name: i for i, name in enumerate(self.items)}
+        for names, index in ((self.users, self.user_index), (self.items, self.item_index)):
+            name = user if names is self.users else item
+            if name not in index:
+                index[name] = len(names)
+                names.append(name)
+        row, col = self.user_index[user], self.item_index[item]
+
+        ratings = self.ratings.tocoo()
+        sequence = self.sequence.tocoo().data
+        existing = (ratings.row == row) & (ratings.col == col)
+        """Changed rating keeps its position, new rating is the last one"""
+        position = sequence[existing][0] if existing.any() else sequence.max(initial=0) + 1
+        data = np.append(ratings.data[~existing], float(rating))
+        rows = np.append(ratings.row[~existing], row)
+        cols = np.append(ratings.col[~existing], col)
+        shape = (len(self.users), len(self.items))
+        self.ratings = sparse.csr_matrix((data.astype(np.float64), (rows, cols)), shape=shape)
+        self.sequence = sparse.csr_matrix((np.append(sequence[~existing], position).astype(np.int64), (rows, cols)),
+                                          shape=shape)
+        self._derive()
+        return row, col
+
+    def block_scores(self, rows, metric='euclidean', columns=None, all_pairs=False):
+        """
+        Compute similarity scores between users from given rows and every user (the users included) in one pass.
+        Sums over common movies are sparse matrix products of ratings, squared ratings and rated pattern, e.g.
+        Euclidean distance is expanded to sum(r_u^2) - 2 * sum(r_u * r_v) + sum(r_v^2)
+
+        :param: rows: row indexes of users
+        :param: metric: 'euclidean' - 1 / (1 + distance) over common movies, 'pearson' - Pearson correlation over
+                common movies, 'cosine' - cosine similarity of whole rating vectors
+        :param: columns: row indexes of users to compare with, all users by default
+        :param: all_pairs: multiply sparse rows by sparse transposed matrix, faster only for big blocks of rows
+                (NeighbourIndex.build), otherwise every sum is a sparse matrix times dense vectors product
+
+        :return: (rows x users or columns) array of scores, 0 for users without common movies
+        """
+        ratings = self.ratings[rows]
+        rated = self.rated[rows]
+        other_ratings, other_rated, other_squared, other_norms = self.ratings, self.rated, self.squared, self.norms
+        if columns is not None:
+            other_ratings, other_rated = self.ratings[columns], self.rated[columns]
+            other_squared, other_norms = self.squared[columns], self.norms[columns]
+
+        def product(a, b):
+            if all_pairs:
+                return (a @ b.T).toarray()
+            return (b @ a.toarray().T).T
+
+        if metric == 'cosine':
+            norms = self.norms[rows][:, None] * other_norms[None, :]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(norms > 0, product(ratings, other_ratings) / norms, 0)
+
+        common = product(rated, other_rated)
+        sum_xy = product(ratings, other_ratings)
+        sum_xx = product(self.squared[rows], other_rated)
+        sum_yy = product(rated, other_squared)
+        if metric == 'euclidean':
+            scores = 1 / (1 + np.sqrt(np.maximum(sum_xx - 2 * sum_xy + sum_yy, 0)))
+            return np.where(common > 0, scores, 0)
+        if metric == 'pearson':
+            sum_x = product(ratings, other_rated)
+            sum_y = product(rated, other_ratings)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                sxy = sum_xy - sum_x * sum_y / common
+                sxx = sum_xx - np.square(sum_x) / common
+                syy = sum_yy - np.square(sum_y) / common
+                scores = sxy / np.sqrt(sxx * syy)
+            return np.where((common > 0) & (sxx * syy > 0), scores, 0)
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+
+    def scores(self, user, metric='euclidean'):
+        """
+        Compute similarity scores between user and every user (the user included)
+
+        :param: user: name of user
+        :param: metric: see block_scores()
+
+        :return: array of scores
+        """
+        return self.block_scores([self.user_index[user]], metric)[0]
+
+
+def top_k(scores, k):
+    """
+    Select indexes of k highest scores in every row in linear time, without sorting whole rows
+
+    :param: scores: (rows x columns) array
+    :param: k: number of selected columns
+
+    :return: (rows x k) array of column indexes sorted from the highest score, ties by lower index
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.intp)
+    """k-th highest score of every row, from equal scores only the lowest indexes are taken"""
+    threshold = -np.partition(-scores, k - 1, axis=1)[:, k - 1, None]
+    above = scores > threshold
+    equal = scores == threshold
+    missing = k - above.sum(axis=1, keepdims=True)
+    selected = above | (equal & (np.cumsum(equal, axis=1) <= missing))
+    candidates = np.nonzero(selected)[1].reshape(scores.shape[0], k)
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class NeighbourIndex:
+    """
+    Precomputed k most similar users of every user, built offline and updated incrementally
+    """
+
+    def __init__(self, users, neighbours, scores, metric):
+        """
+        :param: users: names of users, the same order as in RatingsMatrix
+        :param: neighbours: (users x k) row indexes of most similar users, sorted from the best match
+        :param: scores: (users x k) scores of neighbours
+        :param: metric: similarity metric, see RatingsMatrix.block_scores()
+        """
+        self.users = list(users)
+        self.user_index = {user: i for i, user in enumerate(self.users)}
+        self.neighbours = neighbours
+        self.scores = scores
+        self.metric = metric
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    @classmethod
+    def build(cls, matrix, k=10, metric='euclidean'):
+        """
+        Compute k most similar users of every user, users are scored in blocks to limit memory
+
+        :param: matrix: RatingsMatrix with users, movies and ratings
+        :param: k: number of stored neighbours
+        :param: metric: similarity metric, see RatingsMatrix.block_scores()
+        """
+        users_count = len(matrix.users)
+        k = min(k, users_count - 1)
+        neighbours = np.zeros((users_count, k), dtype=np.int32)
+        scores = np.zeros((users_count, k), dtype=np.float32)
+        index = cls(matrix.users, neighbours, scores, metric)
+        block_size = max(1, BLOCK_ELEMENTS // max(users_count, 1))
+        for start in range(0, users_count, block_size):
+            index._compute_rows(matrix, np.arange(start, min(start + block_size, users_count)), all_pairs=True)
+        return index
+
+    def _compute_rows(self, matrix, rows, all_pairs=False):
+        """
+        Recompute neighbours of users from given rows
+        """
+        block = matrix.block_scores(rows, self.metric, all_pairs=all_pairs)
+        block[np.arange(len(rows)), rows] = -np.inf
+        self.neighbours[rows] = top_k(block, self.k)
+        self.scores[rows] = np.take_along_axis(block, self.neighbours[rows].astype(np.intp), axis=1)
+
+    def update_rating(self, matrix, user, item, rating):
+        """
+        Change rating in matrix and update only affected neighbour lists.
+        Only scores between the user and other users change, so the user row is recomputed and other rows
+        are patched with new score of the user. Rows from which the user drops out are recomputed.
+
+        :param: matrix: RatingsMatrix the index was built from
+        :param: user: name of user
+        :param: item: name of movie
+        :param: rating: new rating
+        """
+        row, _ = matrix.set_rating(user, item, rating)
+        if row == len(self.users):
+            self.users.append(user)
+            self.user_index[user] = row
+            self.neighbours = np.vstack([self.neighbours, np.zeros((1, self.k), dtype=self.neighbours.dtype)])
+            self.scores = np.vstack([self.scores, np.zeros((1, self.k), dtype=self.scores.dtype)])
+
+        new_scores = matrix.block_scores([row], self.metric)[0]
+        new_scores[row] = -np.inf
+        self.neighbours[row] = top_k(new_scores[None, :], self.k)[0]
+        self.scores[row] = new_scores[self.neighbours[row]]
+
+        listed = (self.neighbours == row).any(axis=1)
+        entering = ~listed & (new_scores > self.scores[:, -1])
+        recompute = []
+        for other in np.flatnonzero(listed | entering):
+            if listed[other]:
+                position = np.flatnonzero(self.neighbours[other] == row)[0]
+                others = np.delete(self.scores[other], position)
+                if not len(others) or new_scores[other] < others.min():
+                    recompute.append(other)
+                    continue
+                self.scores[other, position] = new_scores[other]
+            else:
+                self.neighbours[other, -1] = row
+                self.scores[other, -1] = new_scores[other]
+            order = np.lexsort((self.neighbours[other], -self.scores[other]))
+            self.neighbours[other] = self.neighbours[other, order]
+            self.scores[other] = self.scores[other, order]
+        if recompute:
+            self._compute_rows(matrix, np.array(recompute))
+
+    def matches(self, user):
+        """
+        Get precomputed most similar users
+
+        :param: user: name of user
+
+        :return: list of (name, score) sorted from the best match
+        """
+        row = self.user_index[user]
+        return [(self.users[i], float(score)) for i, score in zip(self.neighbours[row], self.scores[row])]
+
+    def save(self, index_file):
+        """
+        Save index to .npz file
+        """
+        np.savez(index_file, users=np.array(self.users), neighbours=self.neighbours, scores=self.scores,
+                 metric=self.metric)
+
+    @classmethod
+    def load(cls, index_file):
+        """
+        Load index saved with save()
+        """
+        with np.load(index_file) as f:
+            return cls(f['users'].tolist(), f['neighbours'], f['scores'], str(f['metric']))
+
+
+class LSHIndex:
+    """
+    Approximate nearest neighbour search with random projection LSH.
+    Users whose rating vectors fall on the same side of random hyperplanes share a bucket,
+    candidates from user's buckets are then scored exactly with the chosen metric
+    """
+
+    def __init__(self, matrix, metric='euclidean', tables=8, bits=None, probes=2, seed=0):
+        """
+        :param: matrix: RatingsMatrix with users, movies and ratings
+        :param: metric: similarity metric, see RatingsMatrix.block_scores(). Vectors are mean-centered
+                for metrics comparing common movies and left as they are for cosine
+        :param: tables: number of hash tables, more tables give better recall
+        :param: bits: hyperplanes per table, more bits give smaller buckets, by default about 16 users per bucket
+        :param: probes: number of neighbouring buckets (one flipped bit each) checked in every table
+        :param: seed: random generator seed
+        """
+        self.matrix = matrix
+        self.metric = metric
+        self.tables = tables
+        self.bits = bits or int(np.clip(np.log2(max(len(matrix.users), 1) / 16), 1, 20))
+        bits = self.bits
+        self.probes = probes
+        self.planes = np.random.default_rng(seed).standard_normal((len(matrix.items), tables * bits),
+                                                                  dtype=np.float32)
+        self.weights = np.left_shift(np.int64(1), np.arange(bits, dtype=np.int64))
+
+        projections = self._project(np.arange(len(matrix.users)))
+        keys = (projections > 0).reshape(len(matrix.users), tables, bits) @ self.weights
+        """Buckets of every table as users sorted by key"""
+        self.order = np.argsort(keys, axis=0, kind='stable').T
+        self.sorted_keys = np.take_along_axis(keys, self.order.T, axis=0).T
+
+    def _project(self, rows):
+        """
+        Project (mean-centered) ratings of users from given rows on hyperplanes
+        """
+        ratings = self.matrix.ratings[rows]
+        if self.metric == 'cosine':
+            return np.asarray(ratings @ self.planes)
+        counts = np.diff(ratings.indptr)
+        means = np.asarray(ratings.sum(axis=1)).ravel() / np.maximum(counts, 1)
+        centered = ratings.copy()
+        centered.data -= np.repeat(means, counts)
+        return np.asarray(centered @ self.planes)
+
+    def candidates(self, user):
+        """
+        Find users sharing a bucket with user in any table, including buckets one flipped bit away
+
+        :param: user: name of user
+
+        :return: array of row indexes of candidates
+        """
+        row = self.matrix.user_index[user]
+        projection = self._project([row])[0].reshape(self.tables, self.bits)
+        keys = (projection > 0) @ self.weights
+        """Probe buckets for bits with projections closest to the hyperplane"""
+        flips = np.argsort(np.abs(projection), axis=1)[:, :self.probes]
+        probe_keys = np.column_stack([keys, keys[:, None] ^ self.weights[flips]])
+
+        found = []
+        for table, table_keys in enumerate(probe_keys):
+            starts = np.searchsorted(self.sorted_keys[table], table_keys, side='left')
+            ends = np.searchsorted(self.sorted_keys[table], table_keys, side='right')
+            found.extend(self.order[table, start:end] for start, end in zip(starts, ends))
+        candidates = np.unique(np.concatenate(found))
+        return candidates[candidates != row]
+
+    def matches(self, user, k=10):
+        """
+        Get approximately most similar users
+
+        :param: user: name of user
+        :param: k: number of returned users
+
+        :return: list of (name, score) sorted from the best match
+        """
+        candidates = self.candidates(user)
+        if len(candidates) < k:
+            """Too few users in buckets, compare with everyone"""
+            candidates = np.flatnonzero(np.arange(len(self.matrix.users)) != self.matrix.user_index[user])
+        scores = self.matrix.block_scores([self.matrix.user_index[user]], self.metric, columns=candidates)
+        best = top_k(scores, k)[0]
+        return [(self.matrix.users[candidates[i]], float(scores[0, i])) for i in best]
+
+
 def get_users_list(dataset):
     """
     Get users list
@@ -68,76 +569,135 @@ def get_users_list(dataset):
     return user_list
 
 
-def get_matching_results(data, user1, users_list):
+def get_matching_results(matrix, user1, users_list=None, k=3):
     """
-    Compute Euclidean and Pearson scores for every user
+    Compute Euclidean scores for every user and select the best matches
 
-    :param: data: contains users, movies and ratings
+    :param: matrix: RatingsMatrix with users, movies and ratings
     :param: user1: name of user1
-    :param: users_list: names of all users
+    :param: users_list: names of compared users, all users except user1 by default
+    :param: k: number of returned users
 
-    :return: Euclidean and Pearson scores for every user
+    :return: generator of (name, score) of k best matching users, sorted from the best match
     """
-    euclidean_score_list = {}
-    for user in users_list:
-        euclidean_score_list[user] = euclidean_score(data, user1, user)
+    scores = matrix.scores(user1)
+    if users_list is None:
+        users = np.flatnonzero(np.arange(len(scores)) != matrix.user_index[user1])
+    else:
+        users = np.array([matrix.user_index[user] for user in users_list], dtype=np.intp)
+    for i in top_k(scores[users][None, :], k)[0]:
+        yield str(matrix.users[users[i]]), float(scores[users[i]])
 
-    euclidean_score_list = sorted(euclidean_score_list.items(), key=lambda x: x[1], reverse=True)
 
-    return euclidean_score_list
-
-
-def print_movies(movies, user1_movies):
+def print_movies(movies):
     """
     Print chosen movies
     """
-    count = 0
     for movie in movies:
-        if count < 5 and movie not in user1_movies:
-            count += 1
-            print(movie)
+        print(movie)
 
 
-def get_recommended_movies(data, user1, matched_user):
+def select_movies(movies, user1_movies, count=5, best=True):
     """
-    Choose recommended movies
+    Select best (or worst) rated movies not seen by user1 with bounded heap, O(n log count)
 
-    :param: data: contains users, movies and ratings
+    :param: movies: dict of movies and ratings
+    :param: user1_movies: movies seen by user1
+    :param: count: number of selected movies
+    :param: best: select highest ratings if True, lowest otherwise
+
+    :return: generator of (movie, rating) sorted by rating, ties in movies order
+    """
+    unseen = ((movie, rating) for movie, rating in movies.items() if movie not in user1_movies)
+    select = heapq.nlargest if best else heapq.nsmallest
+    yield from select(count, unseen, key=lambda x: x[1])
+
+
+def recommended_movies(matrix, user1, matched_user, count=5):
+    """
+    Choose recommended movies: best rated movies of matched user not seen by user1
+
+    :param: matrix: RatingsMatrix with users, movies and ratings
+    :param: user1: name of user1
+    :param: matched_user: name of matched user
+    :param: count: number of movies
+
+    :return: generator of (movie, rating)
+    """
+    return select_movies(matrix.user_ratings(matched_user), matrix.user_ratings(user1), count)
+
+
+def not_recommended_movies(matrix, user1, scores_list, count=5):
+    """
+    Choose not recommended movies: worst rated movies of 3 best matching users not seen by user1
+
+    :param: matrix: RatingsMatrix with users, movies and ratings
+    :param: user1: name of user1
+    :param: scores_list: computed movies scores
+    :param: count: number of movies
+
+    :return: generator of (movie, rating)
+    """
+    """Ratings of better matching users override ratings of worse ones"""
+    movies = {}
+    for user, _ in reversed(scores_list[:3]):
+        movies.update(matrix.user_ratings(user))
+    return select_movies(movies, matrix.user_ratings(user1), count, best=False)
+
+
+def get_recommended_movies(matrix, user1, matched_user):
+    """
+    Print recommended movies
+
+    :param: matrix: RatingsMatrix with users, movies and ratings
     :param: user1: name of user1
     :param: matched_user: name of matched user
     """
-    user1_movies = data[user1]
-    matched_user_movies = sorted(data[matched_user].items(), key=lambda x: x[1], reverse=True)
     print("Recommended movies:")
-    print_movies(matched_user_movies, user1_movies)
+    print_movies(recommended_movies(matrix, user1, matched_user))
 
 
-def get_not_recommended_movies(data, user1, scores_list):
+def get_not_recommended_movies(matrix, user1, scores_list):
     """
-    Choose not recommended movies
+    Print not recommended movies
 
-    :param: data: contains users, movies and ratings
+    :param: matrix: RatingsMatrix with users, movies and ratings
     :param: user1: name of user1
     :param: scores_list: computed movies scores
     """
-    user1_movies = data[user1]
-    not_recommended_movies = data[scores_list[2][0]]
-    not_recommended_movies.update(data[scores_list[1][0]])
-    not_recommended_movies.update(data[scores_list[0][0]])
-    not_recommended_movies = sorted(not_recommended_movies.items(), key=lambda x: x[1])
     print("\nNot recommended movies:")
-    print_movies(not_recommended_movies, user1_movies)
+    print_movies(not_recommended_movies(matrix, user1, scores_list))
 
 
 if __name__ == '__main__':
-    args = build_arg_parser().parse_args()
+    parser = build_arg_parser()
+    args = parser.parse_args()
     user1 = args.user
     ratings_file = 'ratings.json'
 
-    with open(ratings_file, 'r', encoding='UTF8') as f:
-        data = json.loads(f.read())
-
-    users_list = get_users_list(data)
-    euclideanScoreList = get_matching_results(data, user1, users_list)
-    get_recommended_movies(data, user1, euclideanScoreList[0][0])
-    get_not_recommended_movies(data, user1, euclideanScoreList)
+    if args.store:
+        matrix = RatingsMatrix.load(args.store)
+    else:
+        with open(ratings_file, 'r', encoding='UTF8') as f:
+            data = json.loads(f.read())
+        matrix = RatingsMatrix.from_dict(data)
+
+    if args.convert:
+        matrix.save(args.convert)
+        print(f"Ratings saved to {args.convert}")
+    if args.build_index:
+        NeighbourIndex.build(matrix, args.k, args.metric).save(args.build_index)
+        print(f"Index of {args.k} {args.metric} neighbours saved to {args.build_index}")
+    if not user1:
+        if args.convert or args.build_index:
+            parser.exit()
+        parser.error('the following arguments are required: --user')
+
+    if args.index:
+        euclideanScoreList = NeighbourIndex.load(args.index).matches(user1)
+    elif args.ann:
+        euclideanScoreList = LSHIndex(matrix).matches(user1, args.k)
+    else:
+        euclideanScoreList = list(get_matching_results(matrix, user1))
+    get_recommended_movies(matrix, user1, euclideanScoreList[0][0])
+    get_not_recommended_movies(matrix, user1, euclideanScoreList)
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import urllib.parse
+from main import NeighbourIndex, RatingsMatrix, get_matching_results, not_recommended_movies, recommended_movies
+
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Movie recommender as a long-running local HTTP service. Ratings are loaded once and kept in memory,
+queries are answered as JSON and ratings can be changed without restart.
+
+How to run:
+- execute `python server.py [--store STORE] [--index INDEX] [--port 8000]`
+
+Endpoints:
+- GET /recommended?user=NAME&count=5
+- GET /not_recommended?user=NAME&count=5
+- GET /users?limit=100
+- POST /ratings with JSON body {"user": NAME, "movie": MOVIE, "rating": RATING}
+"""
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class NoMatchError(Exception):
+    """
+    There is no other user to match the user with
+    """
+
+
+class ReadWriteLock:
+    """
+    Lets many queries run at the same time, rating updates wait for running queries and run alone.
+    New queries wait while an update is waiting, so updates are not starved by steady query load
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writing and self._writers_waiting == 0)
+            self._readers += 1
+
+    async def release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            self._condition.notify_all()
+
+    async def acquire_write(self):
+        async with self._condition:
+            self._writers_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writing and self._readers == 0)
+            finally:
+                self._writers_waiting -= 1
+                """Cancelled writer may have been the one holding back readers"""
+                self._condition.notify_all()
+            self._writing = True
+
+    async def release_write(self):
+        async with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+
+class RecommenderService:
+    """
+    Keeps ratings matrix (and optional neighbour index) warm and answers queries in a thread pool
+    """
+
+    def __init__(self, matrix, index=None, threads=None):
+        """
+        :param: matrix: RatingsMatrix with users, movies and ratings
+        :param: index: NeighbourIndex used for matching users, exact scores are computed without it
+        :param: threads: number of threads computing queries
+        """
+        self.matrix = matrix
+        self.index = index
+        self.lock = ReadWriteLock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+
+    def matches(self, user):
+        """
+        Get 3 best matching users
+
+        :raise: NoMatchError when there are no other users
+        """
+        if self.index is not None:
+            scores_list = self.index.matches(user)[:3]
+        else:
+            scores_list = list(get_matching_results(self.matrix, user))
+        if not scores_list:
+            raise NoMatchError(f'no users to match {user} with')
+        return scores_list
+
+    def recommended(self, user, count):
+        scores_list = self.matches(user)
+        movies = recommended_movies(self.matrix, user, scores_list[0][0], count)
+        return {'user': user, 'matched_user': scores_list[0][0],
+                'movies': [{'movie': movie, 'rating': rating} for movie, rating in movies]}
+
+    def not_recommended(self, user, count):
+        scores_list = self.matches(user)
+        movies = not_recommended_movies(self.matrix, user, scores_list, count)
+        return {'user': user, 'matched_users': [name for name, _ in scores_list],
+                'movies': [{'movie': movie, 'rating': rating} for movie, rating in movies]}
+
+    def users(self, limit):
+        return {'users': [str(user) for user in self.matrix.users[:limit]]}
+
+    def set_rating(self, user, movie, rating):
+        if self.index is not None:
+            self.index.update_rating(self.matrix, user, movie, rating)
+        else:
+            self.matrix.set_rating(user, movie, rating)
+        return {'user': user, 'movie': movie, 'rating': rating}
+
+    async def dispatch(self, method, target, body):
+        """
+        Route request to service method
+
+        :return: HTTP status and JSON payload
+        """
+        url = urllib.parse.urlsplit(target)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        loop = asyncio.get_running_loop()
+        try:
+            if url.path in ('/recommended', '/not_recommended', '/users'):
+                if method != 'GET':
+                    return 405, {'error': f'{method} not allowed'}
+                if url.path == '/users':
+                    call = (self.users, int(query.get('limit', 100)))
+                else:
+                    handler = self.recommended if url.path == '/recommended' else self.not_recommended
+                    call = (handler, query['user'], int(query.get('count', 5)))
+                await self.lock.acquire_read()
+                try:
+                    return 200, await loop.run_in_executor(self.executor, *call)
+                finally:
+                    await self.lock.release_read()
+            if url.path == '/ratings':
+                if method != 'POST':
+                    return 405, {'error': f'{method} not allowed'}
+                rating = json.loads(body)
+                if not isinstance(rating, dict):
+                    return 400, {'error': 'body has to be a JSON object'}
+                if not isinstance(rating['user'], str) or not isinstance(rating['movie'], str):
+                    return 400, {'error': 'user and movie have to be strings'}
+                call = (self.set_rating, rating['user'], rating['movie'], float(rating['rating']))
+                await self.lock.acquire_write()
+                try:
+                    return 200, await loop.run_in_executor(self.executor, *call)
+                finally:
+                    await self.lock.release_write()
+        except KeyError as e:
+            return (404 if url.path != '/ratings' else 400), {'error': f'missing or unknown {e}'}
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except NoMatchError as e:
+            return 404, {'error': str(e)}
+        return 404, {'error': f'unknown path {url.path}'}
+
+    async def handle(self, reader, writer):
+        """
+        Serve HTTP/1.1 requests of one connection (keep-alive)
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.dispatch(method, target, body)
+                data = json.dumps(payload, ensure_ascii=False).encode('UTF8')
+                writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                             f'Content-Type: application/json; charset=utf-8\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode('latin-1') + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def build_arg_parser():
+    """
+    Enables to input ratings source and server options
+
+    :return: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Movie recommender server')
+    parser.add_argument('--ratings', default='ratings.json', help='Ratings json file')
+    parser.add_argument('--store', metavar='STORE', help='Load ratings from binary store instead of json file')
+    parser.add_argument('--index', metavar='INDEX', help='Match users with precomputed neighbour index')
+    parser.add_argument('--host', default='127.0.0.1', help='Host')
+    parser.add_argument('--port', type=int, default=8000, help='Port')
+    parser.add_argument('--threads', type=int, default=None, help='Number of threads computing queries')
+
+    return parser
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"Serving {len(service.matrix.users)} users on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    if args.store:
+        ratings_matrix = RatingsMatrix.load(args.store)
+    else:
+        with open(args.ratings, 'r', encoding='UTF8') as f:
+            ratings_matrix = RatingsMatrix.from_dict(json.loads(f.read()))
+    neighbour_index = NeighbourIndex.load(args.index) if args.index else None
+
+    try:
+        asyncio.run(serve(RecommenderService(ratings_matrix, neighbour_index, args.threads), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
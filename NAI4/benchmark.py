@@ -0,0 +1,86 @@
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Benchmark of exact SVC against approximated kernel SVC trained on csv chunks (calculate_large)
+on synthetic datasets with increasing number of rows.
+
+How to run:
+- execute code with `python benchmark.py [--rows 2000 8000 32000 128000] [--exact-limit 32000] [--epochs 3]`
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_classification
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+from main import calculate, calculate_large, read_data
+
+FEATURES = 8
+
+
+def synthetic_csv(path, rows, seed=0):
+    """
+    Write non-linear binary classification dataset to csv file without header
+
+    Returns: column names, feature columns and target of written file
+    """
+    X, y = make_classification(rows, FEATURES, n_informative=5, n_redundant=1, n_clusters_per_class=3,
+                               flip_y=0.02, random_state=seed)
+    col_names = [f'x{i}' for i in range(FEATURES)] + ['label']
+    data = pd.DataFrame(X.astype(np.float32), columns=col_names[:-1])
+    data['label'] = y
+    data.to_csv(path, header=False, index=False)
+    return col_names, col_names[:-1], 'label'
+
+
+def benchmark(rows_list, exact_limit, chunk_size, components, epochs):
+    """
+    Print accuracy and fit time of exact SVC and of both kernel approximations for every dataset size
+    """
+    print(f"{'rows':>8} {'model':>22} {'accuracy':>9} {'time [s]':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in rows_list:
+            path = os.path.join(directory, f'{rows}.csv')
+            col_names, feature_cols, target = synthetic_csv(path, rows)
+
+            if rows <= exact_limit:
+                start = time.perf_counter()
+                accuracy = calculate(make_pipeline(StandardScaler(), SVC()),
+                                     *read_data(col_names, feature_cols, target, path, random_state=0))
+                print(f"{rows:>8} {'exact SVC':>22} {accuracy:>9.3f} {time.perf_counter() - start:>9.2f}")
+
+            for approximation in ('nystroem', 'rff'):
+                start = time.perf_counter()
+                accuracy, _ = calculate_large(
+                    lambda: read_data(col_names, feature_cols, target, path, chunk_size, random_state=0),
+                    np.array([0, 1]), components, approximation, epochs)
+                print(f"{rows:>8} {approximation + ' + SGD':>22} {accuracy:>9.3f} "
+                      f"{time.perf_counter() - start:>9.2f}")
+
+
+def build_arg_parser():
+    """
+    Enables to input benchmark sizes
+
+    Returns: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Exact SVC vs approximated kernel SVC trained on chunks')
+    parser.add_argument('--rows', type=int, nargs='+', default=[2000, 8000, 32000, 128000],
+                        help='Dataset sizes')
+    parser.add_argument('--exact-limit', dest='exact_limit', type=int, default=32000,
+                        help='Exact SVC is skipped for bigger datasets')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=10000, help='Number of rows read at once')
+    parser.add_argument('--components', type=int, default=300, help='Number of kernel approximation features')
+    parser.add_argument('--epochs', type=int, default=3, help='Number of passes over the file')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    benchmark(args.rows, args.exact_limit, args.chunk_size, args.components, args.epochs)
@@ -1,9 +1,28 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import math
+import os
+import time
+import sys
+from multiprocessing import shared_memory
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import ParameterGrid, RepeatedStratifiedKFold, StratifiedKFold, train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 from sklearn import metrics
 from sklearn.svm import SVC
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from tabular import load_csv
+
 """
 Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
 
@@ -15,12 +34,80 @@ System requirements:
 
 How to run:
 - execute main function
+- cross-validated evaluation: `python main.py evaluate [--folds 5] [--repeats 3] [--n-jobs N]`
+- hyperparameter tuning: `python main.py tune [--folds 5] [--factor 3] [--n-jobs N] [--output tuning]`
+- training and saving models: `python main.py train [--models models] [--force]`
+- batch prediction: `python main.py predict MODEL --input INPUT.csv --output OUTPUT.csv [--chunk-size 100000]`
+- large datasets: `python main.py large [--chunk-size 100000] [--components 300] [--approximation nystroem|rff]
+  [--epochs 1] [--csv DATA.csv --columns NAME ... [--features NAME ...] [--target NAME]]`
 
 Kyphosis dataset - https://www.kaggle.com/datasets/abbasit/kyphosis-dataset
 """
 
+DATASETS = {
+    'Pima Indians Diabetes': (['pregnant', 'glucose', 'bp', 'skin', 'insulin', 'bmi', 'pedigree', 'age', 'label'],
+                              ['pregnant', 'insulin', 'bmi', 'age', 'glucose', 'bp', 'pedigree'],
+                              'label', 'pima-indians-diabetes.csv'),
+    'Kyphosis': (['Kyphosis', 'Age', 'Number', 'Start'], ['Age', 'Number', 'Start'], 'Kyphosis', 'kyphosis.csv'),
+}
+DTYPES = {
+    'pima-indians-diabetes.csv': ['int8', 'int16', 'int16', 'int8', 'int16', 'float32', 'float32', 'int8', 'int8'],
+    'kyphosis.csv': ['category', 'int16', 'int8', 'int8'],
+}
+MODELS = {
+    'Decision Tree Classifier': DecisionTreeClassifier,
+    'SVC': SVC,
+}
+ARTIFACT_VERSION = 1
+APPROXIMATIONS = {'nystroem': Nystroem, 'rff': RBFSampler}
+PARAM_GRIDS = {
+    'Decision Tree Classifier': {'max_depth': [None, 2, 3, 4, 6, 8, 12],
+                                 'min_samples_split': [2, 5, 10, 20],
+                                 'min_samples_leaf': [1, 2, 5, 10]},
+    'SVC': {'C': [0.1, 1, 10, 100],
+            'gamma': ['scale', 0.001, 0.01, 0.1, 1],
+            'kernel': ['rbf', 'linear', 'poly']},
+}
+
+
+def column_dtypes(col_names, csv_file):
+    """
+    Returns: dict of column name -> compact dtype for known datasets, None for other files
+    """
+    dtypes = DTYPES.get(os.path.basename(csv_file))
+    return dict(zip(col_names, dtypes)) if dtypes else None
+
+
+def load_columns(col_names, csv_file, columns):
+    """
+    The function loads chosen columns of a data set, known data sets are loaded
+    with compact dtypes from binary cache (see tabular.load_csv)
+
+    Parameters:
+    col_names: csv file header
+    csv_file: path to csv file
+    columns: columns to load
+
+    Returns: DataFrame with chosen columns
+    """
+    dtypes = column_dtypes(col_names, csv_file)
+    if dtypes is None:
+        return pd.read_csv(csv_file, header=None, names=col_names, usecols=columns)[columns]
+    data = load_csv(csv_file, dtypes)
+    return pd.DataFrame({name: data[name] for name in columns})
+
 
-def read_data(col_names, feature_cols, target, csv_file):
+def split_chunk(X, y, test_size, random_state=None):
+    """
+    Split chunk by random mask, unlike train_test_split it works for chunks of any size
+
+    Returns: List containing train-test split of inputs
+    """
+    test = np.random.default_rng(random_state).random(len(X)) < test_size
+    return [X[~test], X[test], y[~test], y[test]]
+
+
+def read_data(col_names, feature_cols, target, csv_file, chunk_size=None, random_state=None):
     """
     The function loads a data set from a file and divides it into
     test data and learning data
@@ -30,13 +117,23 @@ def read_data(col_names, feature_cols, target, csv_file):
     feature_cols: features
     target: target to learn
     csv_file: path to csv file
+    chunk_size: if given, file is read in chunks of chunk_size rows and every row of a chunk goes to test data
+    with probability 0.3 (train or test part of a short chunk can be empty)
+    random_state: seed of split
 
-    Returns: List containing train-test split of inputs.
+    Returns: List containing train-test split of inputs
+    (generator of such lists for every chunk if chunk_size is given).
     """
-    pima = pd.read_csv(csv_file, header=None, names=col_names)
+    if chunk_size:
+        chunks = pd.read_csv(csv_file, header=None, names=col_names, dtype=column_dtypes(col_names, csv_file),
+                             chunksize=chunk_size)
+        return (split_chunk(chunk[feature_cols], chunk[target], 0.3,
+                            None if random_state is None else random_state + i)
+                for i, chunk in enumerate(chunks))
+    pima = load_columns(col_names, csv_file, feature_cols + [target])
     X = pima[feature_cols]
     y = pima[target]
-    return train_test_split(X, y, test_size=0.3)
+    return train_test_split(X, y, test_size=0.3, random_state=random_state)
 
 
 def calculate(clf, X_train, X_test, y_train, y_test):
@@ -57,19 +154,436 @@ def calculate(clf, X_train, X_test, y_train, y_test):
     return metrics.accuracy_score(y_test, y_pred)
 
 
-if __name__ == '__main__':
-    print("Pima Indians Diabetes")
-    col_names = ['pregnant', 'glucose', 'bp', 'skin', 'insulin', 'bmi', 'pedigree', 'age', 'label']
-    feature_cols = ['pregnant', 'insulin', 'bmi', 'age', 'glucose', 'bp', 'pedigree']
-    X_train, X_test, y_train, y_test = read_data(col_names, feature_cols, "label", "pima-indians-diabetes.csv")
+def calculate_large(read_chunks, classes, n_components=300, approximation='nystroem', epochs=1, random_state=0):
+    """
+    The function calculates accuracy score of approximated RBF kernel SVC trained out of core:
+    scaler and kernel approximation are fitted on the first chunk, linear SVM (SGD with hinge loss)
+    is trained with partial_fit chunk by chunk, then accuracy is counted on test parts of all chunks
+
+    Params:
+    read_chunks: function returning train-test splits of chunks (read_data with chunk_size and random_state),
+    called once for every epoch and once for testing, so the splits have to be the same every time
+    classes: all target labels
+    n_components: number of kernel approximation features
+    approximation: 'nystroem' or 'rff' (random Fourier features)
+    epochs: number of passes over training parts
+    random_state: seed of approximation and SGD
+
+    Returns: The fraction of correctly classified samples and fitted pipeline
+    """
+    scaler = feature_map = None
+    clf = SGDClassifier(loss='hinge', alpha=1e-4, random_state=random_state)
+    for _ in range(epochs):
+        for X_train, _, y_train, _ in read_chunks():
+            if not len(X_train):
+                continue
+            if scaler is None:
+                scaler = StandardScaler().fit(X_train)
+                """SVC default gamma 'scale' is 1 / (features * variance), variance is 1 after scaling"""
+                feature_map = APPROXIMATIONS[approximation](gamma=1 / X_train.shape[1], random_state=random_state,
+                                                            n_components=min(n_components, len(X_train))
+                                                            if approximation == 'nystroem' else n_components)
+                feature_map.fit(scaler.transform(X_train))
+            clf.partial_fit(feature_map.transform(scaler.transform(X_train)), y_train, classes=classes)
+
+    model = make_pipeline(scaler, feature_map, clf)
+    correct = total = 0
+    for _, X_test, _, y_test in read_chunks():
+        if not len(X_test):
+            continue
+        correct += np.count_nonzero(model.predict(X_test) == np.asarray(y_test))
+        total += len(y_test)
+    return correct / total, model
+
+
+def dataset_hash(csv_file, block_size=1 << 20):
+    """
+    Returns: sha256 of dataset file
+    """
+    digest = hashlib.sha256()
+    with open(csv_file, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_name(dataset, model_name):
+    return f"{dataset}_{model_name}".lower().replace(' ', '_')
+
+
+def train_models(models_dir='models', force=False):
+    """
+    Train every model on every dataset with calculate and save it to models_dir as
+    .joblib file (model with feature columns) and .json file (metadata: dataset hash, accuracy, versions).
+    Model is not retrained when the saved one was trained on dataset with the same hash
+
+    Params:
+    models_dir: directory for models
+    force: retrain even if dataset did not change
+
+    Returns: dict of (dataset, model) -> (metadata, retrained)
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    results = {}
+    for dataset, (col_names, feature_cols, target, csv_file) in DATASETS.items():
+        current_hash = dataset_hash(csv_file)
+        X_train = None
+        for model_name, model in MODELS.items():
+            path = os.path.join(models_dir, artifact_name(dataset, model_name))
+            if not force and os.path.exists(path + '.json') and os.path.exists(path + '.joblib'):
+                with open(path + '.json', 'r', encoding='UTF8') as f:
+                    metadata = json.load(f)
+                if metadata['dataset_hash'] == current_hash and metadata['artifact_version'] == ARTIFACT_VERSION:
+                    results[dataset, model_name] = (metadata, False)
+                    continue
+
+            if X_train is None:
+                X_train, X_test, y_train, y_test = read_data(col_names, feature_cols, target, csv_file)
+            clf = model()
+            metadata = {'dataset': dataset, 'model': model_name, 'col_names': col_names,
+                        'feature_cols': feature_cols, 'target': target, 'dataset_hash': current_hash,
+                        'accuracy': calculate(clf, X_train, X_test, y_train, y_test),
+                        'artifact_version': ARTIFACT_VERSION, 'sklearn_version': sklearn.__version__,
+                        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            joblib.dump({'classifier': clf, **metadata}, path + '.joblib')
+            with open(path + '.json', 'w', encoding='UTF8') as f:
+                json.dump(metadata, f, indent=2)
+            results[dataset, model_name] = (metadata, True)
+    return results
+
+
+def load_model(path):
+    """
+    Load saved model, numpy arrays inside model are memory-mapped
+
+    Returns: dict with classifier and its metadata
+    """
+    artifact = joblib.load(path, mmap_mode='r')
+    if artifact.get('artifact_version') != ARTIFACT_VERSION:
+        raise ValueError(f"{path}: unsupported artifact version {artifact.get('artifact_version')}")
+    if artifact['sklearn_version'] != sklearn.__version__:
+        print(f"Warning: {path} was saved with scikit-learn {artifact['sklearn_version']}, "
+              f"running {sklearn.__version__}")
+    return artifact
+
+
+def predict_csv(model_path, input_file, output_file, chunk_size=100000):
+    """
+    Predict labels for csv file (without header, with the same columns as the dataset, without target
+    or only feature columns)
+    in chunks, model is loaded once. Input rows are written to output file with prediction column appended
+
+    Returns: number of predicted rows
+    """
+    artifact = load_model(model_path)
+    model, feature_cols = artifact['classifier'], artifact['feature_cols']
+    """accepted layouts: whole dataset rows, rows without target, only feature columns"""
+    layouts = {len(columns): columns for columns in
+               (feature_cols, [c for c in artifact['col_names'] if c != artifact['target']], artifact['col_names'])}
+    rows = 0
+    for chunk in pd.read_csv(input_file, header=None, chunksize=chunk_size):
+        if chunk.shape[1] not in layouts:
+            raise ValueError(f"{input_file}: expected {' or '.join(map(str, sorted(layouts)))} columns, "
+                             f"got {chunk.shape[1]}")
+        chunk.columns = layouts[chunk.shape[1]]
+        chunk['prediction'] = model.predict(chunk[feature_cols])
+        chunk.to_csv(output_file, mode='w' if rows == 0 else 'a', header=rows == 0, index=False)
+        rows += len(chunk)
+    return rows
+
+
+def load_arrays(col_names, feature_cols, target, csv_file):
+    """
+    The function loads a data set from a file as numpy arrays
+
+    Parameters:
+    col_names: csv file header
+    feature_cols: features
+    target: target to learn
+    csv_file: path to csv file
+
+    Returns: features, target encoded as class indexes and class labels
+    """
+    data = load_columns(col_names, csv_file, feature_cols + [target])
+    classes, y = np.unique(data[target].to_numpy(), return_inverse=True)
+    return data[feature_cols].to_numpy(dtype=np.float64), y, classes
+
+
+def share_arrays(arrays):
+    """
+    Copy arrays into shared memory once, so worker processes can use them without copying
+
+    Params:
+    arrays: dict of numpy arrays
+
+    Returns: list of SharedMemory blocks (to be closed and unlinked) and descriptors for attach_arrays
+    """
+    blocks, descriptors = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, descriptors
+
+
+_attached_blocks = {}
+
+
+def attach_arrays(descriptors):
+    """
+    Get numpy views of arrays shared with share_arrays, every block is attached once per process
+    """
+    arrays = {}
+    for name, (block_name, shape, dtype) in descriptors.items():
+        if block_name not in _attached_blocks:
+            _attached_blocks[block_name] = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=_attached_blocks[block_name].buf)
+    return arrays
+
+
+def evaluate_fold(descriptors, model_name, train, test):
+    """
+    Fit model on one cross-validation fold of shared dataset
+
+    Returns: accuracy, fit time and predict time
+    """
+    data = attach_arrays(descriptors)
+    clf = MODELS[model_name]()
+    start = time.perf_counter()
+    clf.fit(data['X'][train], data['y'][train])
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = clf.predict(data['X'][test])
+    predict_time = time.perf_counter() - start
+    return metrics.accuracy_score(data['y'][test], y_pred), fit_time, predict_time
+
+
+def evaluate(folds=5, repeats=3, n_jobs=None, random_state=0):
+    """
+    Repeated stratified k-fold cross-validation of every model on every dataset, folds run in a process pool
+
+    Params:
+    folds: number of folds
+    repeats: number of repetitions with different splits
+    n_jobs: number of processes, all cores by default
+    random_state: seed of splits
+
+    Returns: dict of (dataset, model) -> accuracy mean, accuracy stdev, mean fit time, mean predict time
+    """
+    cv = RepeatedStratifiedKFold(n_splits=folds, n_repeats=repeats, random_state=random_state)
+    blocks = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(n_jobs or os.cpu_count()) as executor:
+            futures = {}
+            for dataset, dataset_config in DATASETS.items():
+                X, y, _ = load_arrays(*dataset_config)
+                dataset_blocks, descriptors = share_arrays({'X': X, 'y': y})
+                blocks.extend(dataset_blocks)
+                for model_name in MODELS:
+                    futures[dataset, model_name] = [executor.submit(evaluate_fold, descriptors, model_name, train, test)
+                                                    for train, test in cv.split(X, y)]
+            results = {}
+            for key, fold_futures in futures.items():
+                accuracy, fit_time, predict_time = np.array([f.result() for f in fold_futures]).T
+                results[key] = accuracy.mean(), accuracy.std(ddof=1), fit_time.mean(), predict_time.mean()
+            return results
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
 
-    print("Decision Tree Classifier Accuracy: ", calculate(DecisionTreeClassifier(), X_train, X_test, y_train, y_test))
-    print("SVC Accuracy: ", calculate(SVC(), X_train, X_test, y_train, y_test))
 
-    print("\nKyphosis")
-    col_names = ["Kyphosis", "Age", "Number", "Start"]
-    feature_cols = ["Age", "Number", "Start"]
-    X_train, X_test, y_train, y_test = read_data(col_names, feature_cols, "Kyphosis", "kyphosis.csv")
+def evaluate_candidate(descriptors, model_name, params, fold, budget):
+    """
+    Fit model with given parameters on the first budget samples of training part of cached fold
+
+    Returns: accuracy and fit time
+    """
+    data = attach_arrays(descriptors)
+    order = data['order']
+    train = order[data['fold_ids'][order] != fold][:budget]
+    test = data['fold_ids'] == fold
+    X = data['X_scaled'][fold]
+    clf = MODELS[model_name](**params)
+    start = time.perf_counter()
+    clf.fit(X[train], data['y'][train])
+    fit_time = time.perf_counter() - start
+    return metrics.accuracy_score(data['y'][test], clf.predict(X[test])), fit_time
+
+
+def successive_halving(executor, descriptors, model_name, candidates, folds, max_budget, min_budget, factor=3):
+    """
+    Evaluate all candidates on small training budget, keep the best 1/factor of them and repeat
+    with budget multiplied by factor, until the last round uses whole training folds
+
+    Returns: best parameters, their accuracy and timing of every round
+    """
+    rounds = min(1 + math.floor(math.log(len(candidates), factor)),
+                 1 + math.floor(math.log(max(max_budget // min_budget, 1), factor)))
+    report = []
+    for i in range(rounds):
+        budget = int(max_budget / factor ** (rounds - 1 - i))
+        start = time.perf_counter()
+        futures = [[executor.submit(evaluate_candidate, descriptors, model_name, params, fold, budget)
+                    for fold in range(folds)] for params in candidates]
+        results = np.array([[f.result() for f in fold_futures] for fold_futures in futures])
+        accuracy = results[:, :, 0].mean(axis=1)
+        report.append({'round': i, 'budget': budget, 'candidates': len(candidates),
+                       'seconds': time.perf_counter() - start, 'mean_fit_seconds': float(results[:, :, 1].mean()),
+                       'best_accuracy': float(accuracy.max())})
+        keep = 1 if i == rounds - 1 else math.ceil(len(candidates) / factor)
+        best = np.argsort(-accuracy, kind='stable')[:keep]
+        candidates = [candidates[j] for j in best]
+        best_accuracy = float(accuracy[best[0]])
+    return candidates[0], best_accuracy, report
+
+
+def tune(folds=5, factor=3, n_jobs=None, output_dir='tuning', random_state=0):
+    """
+    Successive halving search of PARAM_GRIDS for every model on every dataset, candidates run in a process pool.
+    Fold splits and standardized training arrays are computed once per dataset and shared by all candidates.
+    Best model refitted on whole dataset and timing report are saved to output_dir
+
+    Params:
+    folds: number of folds
+    factor: fraction of candidates kept in every round is 1/factor
+    n_jobs: number of processes, all cores by default
+    output_dir: directory for best models (.joblib) and reports (.json)
+    random_state: seed of splits
+
+    Returns: dict of (dataset, model) -> report
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    reports = {}
+    with concurrent.futures.ProcessPoolExecutor(n_jobs or os.cpu_count()) as executor:
+        for dataset, dataset_config in DATASETS.items():
+            X, y, classes = load_arrays(*dataset_config)
+            fold_ids = np.zeros(len(y), dtype=np.intp)
+            cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_state)
+            for fold, (_, test) in enumerate(cv.split(X, y)):
+                fold_ids[test] = fold
+            X_scaled = np.stack([StandardScaler().fit(X[fold_ids != fold]).transform(X) for fold in range(folds)])
+            order = np.random.default_rng(random_state).permutation(len(y))
+            blocks, descriptors = share_arrays({'X_scaled': X_scaled, 'y': y, 'fold_ids': fold_ids, 'order': order})
+            try:
+                for model_name in MODELS:
+                    start = time.perf_counter()
+                    params, accuracy, rounds = successive_halving(
+                        executor, descriptors, model_name, list(ParameterGrid(PARAM_GRIDS[model_name])), folds,
+                        max_budget=int(np.bincount(fold_ids).min() * (folds - 1)),
+                        min_budget=2 * folds * len(classes), factor=factor)
+                    model = make_pipeline(StandardScaler(), MODELS[model_name](**params)).fit(X, classes[y])
+
+                    name = artifact_name(dataset, model_name)
+                    joblib.dump(model, os.path.join(output_dir, name + '.joblib'))
+                    report = {'dataset': dataset, 'model': model_name, 'params': params, 'accuracy': accuracy,
+                              'seconds': time.perf_counter() - start, 'rounds': rounds}
+                    with open(os.path.join(output_dir, name + '.json'), 'w', encoding='UTF8') as f:
+                        json.dump(report, f, indent=2)
+                    reports[dataset, model_name] = report
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+    return reports
+
+
+def build_arg_parser():
+    """
+    Enables to choose between single split run, cross-validated evaluation, tuning, training, prediction
+    and large datasets mode
+
+    Returns: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Decision Tree Classifier and SVC')
+    commands = parser.add_subparsers(dest='command')
+    evaluate_parser = commands.add_parser('evaluate', help='Repeated k-fold cross-validation in parallel')
+    evaluate_parser.add_argument('--folds', type=int, default=5, help='Number of folds')
+    evaluate_parser.add_argument('--repeats', type=int, default=3, help='Number of repetitions')
+    evaluate_parser.add_argument('--n-jobs', dest='n_jobs', type=int, default=None,
+                                 help='Number of processes (default: all cores)')
+    tune_parser = commands.add_parser('tune', help='Successive halving hyperparameter search in parallel')
+    tune_parser.add_argument('--folds', type=int, default=5, help='Number of folds')
+    tune_parser.add_argument('--factor', type=int, default=3, help='Only 1/factor of candidates pass every round')
+    tune_parser.add_argument('--n-jobs', dest='n_jobs', type=int, default=None,
+                             help='Number of processes (default: all cores)')
+    tune_parser.add_argument('--output', default='tuning', help='Directory for best models and timing reports')
+    train_parser = commands.add_parser('train', help='Train models and save them, unchanged datasets are skipped')
+    train_parser.add_argument('--models', default='models', help='Directory for saved models')
+    train_parser.add_argument('--force', action='store_true', help='Retrain even if dataset did not change')
+    predict_parser = commands.add_parser('predict', help='Predict labels of csv file with saved model')
+    predict_parser.add_argument('model', help='Saved model (.joblib)')
+    predict_parser.add_argument('--input', required=True, help='Csv file without header')
+    predict_parser.add_argument('--output', required=True, help='Csv file for predictions')
+    predict_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=100000,
+                                help='Number of rows predicted at once')
+    large_parser = commands.add_parser('large', help='Approximated kernel SVC trained on csv chunks')
+    large_parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=100000,
+                              help='Number of rows read at once')
+    large_parser.add_argument('--components', type=int, default=300, help='Number of kernel approximation features')
+    large_parser.add_argument('--approximation', choices=sorted(APPROXIMATIONS), default='nystroem',
+                              help='Kernel approximation: Nystroem or random Fourier features')
+    large_parser.add_argument('--epochs', type=int, default=1, help='Number of passes over the file')
+    large_parser.add_argument('--csv', help='Csv file without header (default: built-in datasets)')
+    large_parser.add_argument('--columns', nargs='+', help='Column names of the csv file')
+    large_parser.add_argument('--features', nargs='+', help='Feature columns (default: all but target)')
+    large_parser.add_argument('--target', help='Target column (default: the last column)')
+
+    return parser
+
+
+def print_evaluation(results, folds, repeats):
+    """
+    Print cross-validation results
+    """
+    print(f"{folds}-fold cross-validation repeated {repeats} times")
+    for (dataset, model_name), (mean, stdev, fit_time, predict_time) in results.items():
+        print(f"{dataset} - {model_name}: accuracy {mean:.3f} +/- {stdev:.3f}, "
+              f"fit {fit_time * 1000:.2f} ms, predict {predict_time * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.command == 'evaluate':
+        print_evaluation(evaluate(args.folds, args.repeats, args.n_jobs), args.folds, args.repeats)
+    elif args.command == 'tune':
+        for (dataset, model_name), report in tune(args.folds, args.factor, args.n_jobs, args.output).items():
+            print(f"{dataset} - {model_name}: accuracy {report['accuracy']:.3f} with {report['params']}, "
+                  f"{len(report['rounds'])} rounds in {report['seconds']:.2f} s")
+    elif args.command == 'train':
+        for (dataset, model_name), (metadata, retrained) in train_models(args.models, args.force).items():
+            print(f"{dataset} - {model_name}: accuracy {metadata['accuracy']:.3f}"
+                  + ("" if retrained else " (dataset unchanged, saved model kept)"))
+    elif args.command == 'predict':
+        start = time.perf_counter()
+        rows = predict_csv(args.model, args.input, args.output, args.chunk_size)
+        print(f"Predicted {rows} rows in {time.perf_counter() - start:.2f} s")
+    elif args.command == 'large':
+        datasets = DATASETS
+        if args.csv:
+            if not args.columns:
+                parser.error('--columns is required with --csv')
+            target = args.target or args.columns[-1]
+            feature_cols = args.features or [name for name in args.columns if name != target]
+            unknown = [name for name in feature_cols + [target] if name not in args.columns]
+            if unknown:
+                parser.error(f"unknown columns: {', '.join(unknown)}")
+            datasets = {os.path.basename(args.csv): (args.columns, feature_cols, target, args.csv)}
+        for dataset, (col_names, feature_cols, target, csv_file) in datasets.items():
+            classes = np.unique(pd.read_csv(csv_file, header=None, names=col_names, usecols=[target],
+                                            dtype=column_dtypes(col_names, csv_file))[target])
+            start = time.perf_counter()
+            accuracy, _ = calculate_large(
+                lambda: read_data(col_names, feature_cols, target, csv_file, args.chunk_size, random_state=0),
+                classes, args.components, args.approximation, args.epochs)
+            print(f"{dataset} - approximated SVC Accuracy: {accuracy} ({time.perf_counter() - start:.2f} s)")
+    else:
+        for i, (dataset, (col_names, feature_cols, target, csv_file)) in enumerate(DATASETS.items()):
+            print(("\n" if i else "") + dataset)
+            X_train, X_test, y_train, y_test = read_data(col_names, feature_cols, target, csv_file)
 
-    print("Decision Tree Classifier Accuracy: ", calculate(DecisionTreeClassifier(), X_train, X_test, y_train, y_test))
-    print("SVC Accuracy: ", calculate(SVC(), X_train, X_test, y_train, y_test))
+            print("Decision Tree Classifier Accuracy: ",
+                  calculate(DecisionTreeClassifier(), X_train, X_test, y_train, y_test))
+            print("SVC Accuracy: ", calculate(SVC(), X_train, X_test, y_train, y_test))
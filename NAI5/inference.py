@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from main import EXPERIMENTS, evaluation_split, experiment_dataset
+
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Post-training quantization of trained experiments (see main.py) to TFLite models and fast CPU inference.
+The quantized model is compared with the Keras model on the same samples: accuracy drop, throughput gain
+and size of the model file. Report is written to experiments/EXPERIMENT/quantization_QUANTIZATION.json
+
+How to run:
+- train experiment with `python main.py EXPERIMENT`
+- execute `python inference.py EXPERIMENT [--quantization int8|float16] [--batch-size 256] [--threads N]`
+"""
+
+QUANTIZATIONS = ('int8', 'float16')
+
+
+def export_tflite(model, path, quantization='int8', representative=None, representative_samples=200):
+    """
+    Convert Keras model to TFLite file with post-training quantization
+
+    Params:
+    model: trained Keras model
+    path: path of .tflite file
+    quantization: 'int8' (weights and activations, needs representative) or 'float16' (weights)
+    representative: tf.data.Dataset of (samples, labels) batches used to calibrate int8 activations
+    representative_samples: number of calibration samples
+
+    Returns: path
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        """inputs and outputs stay float32, so the interpreter is used the same way as the Keras model"""
+        converter.representative_dataset = lambda: ([sample] for sample, _ in
+                                                    representative.unbatch().batch(1).take(representative_samples))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"unknown quantization {quantization}")
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+
+class TFLiteClassifier:
+    """
+    Batch inference with TFLite model, interpreter is created once and its input is resized only
+    when batch size changes
+    """
+
+    def __init__(self, path, threads=None):
+        """
+        Params:
+        path: .tflite file
+        threads: number of interpreter threads, default by TensorFlow
+        """
+        self.interpreter = tf.lite.Interpreter(model_path=path, num_threads=threads)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def _resize(self, batch_size):
+        if batch_size != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input['index'], [batch_size, *self.input['shape'][1:]])
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+    def predict(self, data, batch_size=256):
+        """
+        Params:
+        data: float32 samples (scaled like in training)
+        batch_size: number of samples in one interpreter call
+
+        Returns: model outputs for all samples
+        """
+        outputs = []
+        for start in range(0, len(data), batch_size):
+            batch = data[start:start + batch_size]
+            self._resize(len(batch))
+            self.interpreter.set_tensor(self.input['index'], batch)
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self.output['index']).copy())
+        return np.concatenate(outputs)
+
+
+def accuracy(outputs, labels):
+    """
+    Returns: accuracy of softmax outputs or of single output thresholded at 0.5 (like Keras 'accuracy')
+    """
+    predictions = (outputs[:, 0] > 0.5).astype(int) if outputs.shape[1] == 1 else np.argmax(outputs, axis=1)
+    return float(np.mean(predictions == labels))
+
+
+def compare(name, quantization='int8', batch_size=256, threads=None, output_dir='experiments'):
+    """
+    Export trained experiment to quantized TFLite model and compare it with Keras model on the same samples
+
+    Params:
+    name: name of trained experiment
+    quantization: 'int8' or 'float16'
+    batch_size: number of samples predicted at once by both models
+    threads: number of threads of both models
+    output_dir: directory with trained experiments
+
+    Returns: report dict
+    """
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    experiment = EXPERIMENTS[name]
+    experiment_dir = os.path.join(output_dir, name)
+    keras_file = os.path.join(experiment_dir, 'model.keras')
+    model = tf.keras.models.load_model(keras_file)
+
+    split = evaluation_split(experiment)
+    batches = list(experiment_dataset(experiment, split, False, batch_size))
+    data = np.concatenate([samples.numpy() for samples, _ in batches])
+    labels = np.concatenate([batch_labels.numpy() for _, batch_labels in batches]).reshape(-1)
+
+    start = time.perf_counter()
+    keras_outputs = model.predict(data, batch_size=batch_size, verbose=0)
+    keras_time = time.perf_counter() - start
+
+    tflite_file = export_tflite(model, os.path.join(experiment_dir, f'model_{quantization}.tflite'), quantization,
+                                experiment_dataset(experiment, 'train', True))
+    classifier = TFLiteClassifier(tflite_file, threads)
+    start = time.perf_counter()
+    tflite_outputs = classifier.predict(data, batch_size)
+    tflite_time = time.perf_counter() - start
+
+    report = {'experiment': name, 'quantization': quantization, 'split': split, 'samples': len(data),
+              'batch_size': batch_size, 'threads': threads,
+              'keras_accuracy': accuracy(keras_outputs, labels), 'tflite_accuracy': accuracy(tflite_outputs, labels),
+              'keras_samples_per_second': len(data) / keras_time, 'tflite_samples_per_second': len(data) / tflite_time,
+              'keras_size_bytes': os.path.getsize(keras_file), 'tflite_size_bytes': os.path.getsize(tflite_file)}
+    report['accuracy_drop'] = report['keras_accuracy'] - report['tflite_accuracy']
+    report['speedup'] = keras_time / tflite_time
+    with open(os.path.join(experiment_dir, f'quantization_{quantization}.json'), 'w', encoding='UTF8') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def build_arg_parser():
+    """
+    Enables to choose experiment and inference options
+
+    Returns: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Quantized TFLite export and inference')
+    parser.add_argument('experiment', choices=list(EXPERIMENTS), help='Trained experiment')
+    parser.add_argument('--quantization', choices=QUANTIZATIONS, default='int8', help='Quantization type')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, default=256, help='Samples predicted at once')
+    parser.add_argument('--threads', type=int, default=None, help='Number of threads')
+    parser.add_argument('--output', default='experiments', help='Directory with trained experiments')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    result = compare(args.experiment, args.quantization, args.batch_size, args.threads, args.output)
+    print(f"{result['experiment']} ({result['quantization']}, {result['samples']} {result['split']} samples)")
+    print(f"Keras:  accuracy {result['keras_accuracy']:.4f}, {result['keras_samples_per_second']:.0f} samples/s, "
+          f"{result['keras_size_bytes'] / 1024:.0f} kB")
+    print(f"TFLite: accuracy {result['tflite_accuracy']:.4f}, {result['tflite_samples_per_second']:.0f} samples/s, "
+          f"{result['tflite_size_bytes'] / 1024:.0f} kB")
+    print(f"Accuracy drop {result['accuracy_drop']:.4f}, speedup {result['speedup']:.2f}x")
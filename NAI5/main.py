@@ -1,65 +1,216 @@
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 import seaborn as sns
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from tabular import load_csv
+
 """
 Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
 
 How to run:
 - download required libraries, framework (matplotlib.pyplot, numpy, pandas, tensorflow, seaborn)
-- execute main function
+- execute main function: `python main.py [EXPERIMENT ...] [--jobs 1] [--threads N] [--output experiments]`,
+  experiments sharing a data set run one after another in their own process (the data set is loaded once),
+  models are saved after every epoch (interrupted experiments are resumed)
+  and summary with accuracy, epochs per second and memory (peak RSS of the group process and its growth
+  during the experiment) is written to experiments/summary.json
+- quantized TFLite export and comparison with Keras model: `python inference.py EXPERIMENT [--quantization int8]`
+
+Csv datasets are loaded with compact dtypes and cached in binary form (see tabular.py in the repository root)
 """
 
-if __name__ == '__main__':
+PIMA_DTYPES = {'pregnant': 'int8', 'glucose': 'int16', 'bp': 'int16', 'skin': 'int8', 'insulin': 'int16',
+               'bmi': 'float32', 'pedigree': 'float32', 'age': 'int8', 'class': 'int8'}
+PHONEME_DTYPES = {'var1': 'float32', 'var2': 'float32', 'var3': 'float32', 'var4': 'float32', 'var5': 'float32',
+                  'class': 'int8'}
+BATCH_SIZE = 32
+ANIMAL_CLASSES = [2, 3, 4, 5, 6, 7]
+
+
+def load_tabular(csv_file, dtypes):
+    """
+    Returns: samples (float32 array of all columns but class) and labels of csv data set
+    """
+    data = pd.DataFrame(load_csv(csv_file, dtypes))
+    train_label = data.pop('class')
+    return np.array(data, dtype=np.float32), train_label.to_numpy()
+
+
+"""Loaders of data sets: name -> function returning dict split -> (samples, labels)"""
+DATASETS = {
+    'pima': lambda: {'train': load_tabular('pima-indians-diabetes.csv', PIMA_DTYPES)},
+    'phoneme': lambda: {'train': load_tabular('phoneme.csv', PHONEME_DTYPES)},
+    'cifar10': lambda: dict(zip(('train', 'test'), tf.keras.datasets.cifar10.load_data())),
+    'fashion_mnist': lambda: dict(zip(('train', 'test'), tf.keras.datasets.fashion_mnist.load_data())),
+}
+LOADED_DATASETS = {}
+
+
+def get_dataset(name, split='train'):
+    """
+    Data set from registry, it is loaded and converted to tensors only on the first call
+
+    Params:
+    name: name of data set in DATASETS
+    split: 'train' or 'test'
+
+    Returns: (samples, labels) tensors in original dtypes (uint8 images)
+    """
+    if name not in LOADED_DATASETS:
+        LOADED_DATASETS[name] = {key: (tf.constant(data), tf.constant(labels))
+                                 for key, (data, labels) in DATASETS[name]().items()}
+    return LOADED_DATASETS[name][split]
+
+
+def class_subset(labels, classes):
+    """
+    Select samples of given classes without copying them, labels are renumbered by lookup table
+    (classes[i] -> i, other classes -> -1)
+
+    Params:
+    labels: labels tensor of whole data set
+    classes: chosen classes
+
+    Returns: indexes of chosen samples and renumbered labels of whole data set
+    """
+    labels = labels.numpy()
+    lookup = np.full(max(labels.max(), max(classes)) + 1, -1, dtype=np.int32)
+    lookup[classes] = np.arange(len(classes))
+    subset_labels = lookup[labels]
+    return np.flatnonzero(subset_labels.reshape(len(labels), -1)[:, 0] >= 0), subset_labels
+
+
+def make_dataset(data, labels, index=None, scale=1.0, shuffle=True, batch_size=BATCH_SIZE):
     """
-        Pima Indians Diabetes classifying
+    Input pipeline for model.fit/predict. Samples are kept in their own dtype (uint8 images are not copied
+    as floats), batches of indexes are gathered from samples, converted to float32 and scaled in parallel map
+    and prefetched during training
+
+    Params:
+    data: samples tensor
+    labels: labels tensor (or array)
+    index: indexes of used samples, all samples by default
+    scale: samples are multiplied by scale (1 / 255 for images)
+    shuffle: shuffle samples every epoch (like model.fit with arrays)
+    batch_size: number of samples in batch
+
+    Returns: tf.data.Dataset of (samples, labels) batches
     """
-    print("====================\nPima Indians Diabetes authentication\n====================")
-    b_data = pd.read_csv('pima-indians-diabetes.csv',
-                         names=['pregnant', 'glucose', 'bp', 'skin', 'insulin', 'bmi', 'pedigree', 'age', 'class'])
-    b_train_data = b_data.copy()
-    b_train_label = b_data.pop('class')
-    b_train_data = np.array(b_train_data)
+    if index is None:
+        index = np.arange(len(labels))
+    dataset = tf.data.Dataset.from_tensor_slices(index).cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(index), reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(lambda i: (tf.cast(tf.gather(data, i), tf.float32) * scale, tf.gather(labels, i)),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
 
-    b_model = tf.keras.Sequential([tf.keras.layers.Dense(64, activation='relu'),
-                                   tf.keras.layers.Dense(1)
-                                   ])
-    b_model.compile(optimizer='adam',
-                    loss='mean_squared_error',
-                    metrics=['accuracy']
-                    )
-    b_model.fit(b_train_data, b_train_label, epochs=30)
 
+def build_dense_model():
     """
-        Confusion Matrix for CIFAR10 dataset
+    Returns: compiled model for csv data sets
     """
-    print("====================\nConfusion Matrix for CIFAR10 dataset\n===================")
-    cifar10_data = tf.keras.datasets.cifar10
-    (c_train_data, c_train_label), (c_test_data, c_test_label) = cifar10_data.load_data()
-    c_train_data = c_train_data / 255
-    c_test_data = c_test_data / 255
+    model = tf.keras.Sequential([tf.keras.layers.Dense(64, activation='relu'),
+                                 tf.keras.layers.Dense(1)
+                                 ])
+    model.compile(optimizer='adam',
+                  loss='mean_squared_error',
+                  metrics=['accuracy']
+                  )
+    return model
+
 
-    cifar3_model = tf.keras.models.Sequential(
+def build_cnn_model(classes):
+    """
+    Returns: compiled convolutional model for CIFAR10 images
+    """
+    model = tf.keras.models.Sequential(
         [tf.keras.layers.Conv2D(filters=32, kernel_size=(3, 3), activation='relu', input_shape=(32, 32, 3)),
          tf.keras.layers.MaxPooling2D((2, 2)),
          tf.keras.layers.Conv2D(filters=64, kernel_size=(3, 3), activation='relu'),
          tf.keras.layers.MaxPooling2D((2, 2)),
          tf.keras.layers.Flatten(),
          tf.keras.layers.Dense(256, activation='relu'),
-         tf.keras.layers.Dense(10, activation='softmax')
+         tf.keras.layers.Dense(classes, activation='softmax')
          ])
-    cifar3_model.compile(optimizer='adam',
-                         loss='sparse_categorical_crossentropy',
-                         metrics=['accuracy']
-                         )
-    cifar3_model.fit(c_train_data, c_train_label, epochs=5)
+    model.compile(optimizer='adam',
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy']
+                  )
+    return model
+
+
+def build_clothes_model():
+    """
+    Returns: compiled model for Fashion MNIST images
+    """
+    model = tf.keras.Sequential([tf.keras.layers.Flatten(input_shape=(28, 28)),
+                                 tf.keras.layers.Dense(128, activation='relu'),
+                                 tf.keras.layers.Dense(10, activation='softmax')
+                                 ])
+    model.compile(optimizer='adam',
+                  loss='sparse_categorical_crossentropy',
+                  metrics=['accuracy']
+                  )
+    return model
+
+
+"""
+Experiments: name -> data set, model builder with its arguments, number of epochs, scale of samples,
+optional subset of classes and optional class names for confusion matrix
+"""
+EXPERIMENTS = {
+    'pima': {'dataset': 'pima', 'model': build_dense_model, 'epochs': 30},
+    'cifar10': {'dataset': 'cifar10', 'model': build_cnn_model, 'model_args': (10,), 'epochs': 5, 'scale': 1 / 255,
+                'class_names': ['airplane', 'automobile', 'bird', 'cat', 'deer', 'dog', 'frog', 'horse', 'ship',
+                                'truck']},
+    'animals': {'dataset': 'cifar10', 'classes': ANIMAL_CLASSES, 'model': build_cnn_model, 'model_args': (6,),
+                'epochs': 5, 'scale': 1 / 255},
+    'animals_10_epochs': {'dataset': 'cifar10', 'classes': ANIMAL_CLASSES, 'model': build_cnn_model,
+                          'model_args': (6,), 'epochs': 10, 'scale': 1 / 255},
+    'fashion_mnist': {'dataset': 'fashion_mnist', 'model': build_clothes_model, 'epochs': 10, 'scale': 1 / 255},
+    'phoneme': {'dataset': 'phoneme', 'model': build_dense_model, 'epochs': 3},
+}
 
-    class_names = ['airplane', 'automobile', 'bird', 'cat', 'deer', 'dog', 'frog', 'horse', 'ship', 'truck']
 
-    image_classes_prediction = np.argmax(cifar3_model.predict(c_test_data), axis=1)
-    confusion_matrix = tf.math.confusion_matrix(labels=c_test_label, predictions=image_classes_prediction).numpy()
+def experiment_dataset(experiment, split, shuffle, batch_size=BATCH_SIZE):
+    """
+    Returns: input pipeline of experiment data set split
+    """
+    data, labels = get_dataset(experiment['dataset'], split)
+    index = None
+    if 'classes' in experiment:
+        index, labels = class_subset(labels, experiment['classes'])
+    return make_dataset(data, labels, index, experiment.get('scale', 1.0), shuffle, batch_size)
+
+
+def evaluation_split(experiment):
+    """
+    Returns: 'test' if data set of experiment has test split, otherwise 'train'
+    """
+    get_dataset(experiment['dataset'])
+    return 'test' if 'test' in LOADED_DATASETS[experiment['dataset']] else 'train'
+
+
+def save_confusion_matrix(model, dataset, labels, class_names, path):
+    """
+    Save normalized confusion matrix of model predictions as image
+    """
+    image_classes_prediction = np.argmax(model.predict(dataset), axis=1)
+    confusion_matrix = tf.math.confusion_matrix(labels=tf.reshape(labels, [-1]),
+                                                predictions=image_classes_prediction).numpy()
     confusion_matrix_norm = np.around(confusion_matrix.astype('float') / confusion_matrix.sum(axis=1)[:, np.newaxis],
                                       decimals=2)
     confusion_matrix_df = pd.DataFrame(confusion_matrix_norm, index=class_names, columns=class_names)
@@ -69,152 +220,177 @@ if __name__ == '__main__':
     plt.tight_layout()
     plt.ylabel('True')
     plt.xlabel('Predicted')
-    plt.show()
-
-    print("====================\nAnimals from CIFAR10 classifying [5] tests\n====================")
-    cifar10_data = tf.keras.datasets.cifar10
-    (c_train_data, c_train_label), (c_test_data, c_test_label) = cifar10_data.load_data()
-    c_train_data = c_train_data / 255
-    c_test_data = c_test_data / 255
-
-    bird_index = np.where(c_train_label.reshape(-1) == 2)
-    bird_data = c_train_data[bird_index]
-    bird_label = c_train_label[bird_index]
-
-    cat_index = np.where(c_train_label.reshape(-1) == 3)
-    cat_data = c_train_data[cat_index]
-    cat_label = c_train_label[cat_index]
-
-    deer_index = np.where(c_train_label.reshape(-1) == 4)
-    deer_data = c_train_data[deer_index]
-    deer_label = c_train_label[deer_index]
-
-    dog_index = np.where(c_train_label.reshape(-1) == 5)
-    dog_data = c_train_data[dog_index]
-    dog_label = c_train_label[dog_index]
-
-    frog_index = np.where(c_train_label.reshape(-1) == 6)
-    frog_data = c_train_data[frog_index]
-    frog_label = c_train_label[frog_index]
-
-    horse_index = np.where(c_train_label.reshape(-1) == 7)
-    horse_data = c_train_data[horse_index]
-    horse_label = c_train_label[horse_index]
-
-    animals_train_data = np.concatenate((bird_data, cat_data, deer_data, dog_data, frog_data, horse_data))
-    animals_train_label = np.concatenate(
-        (bird_label, cat_label, deer_label, dog_label, frog_label, horse_label)).reshape(
-        -1, 1)
-    animals_train_label[animals_train_label == 2] = 0
-    animals_train_label[animals_train_label == 3] = 1
-    animals_train_label[animals_train_label == 4] = 2
-    animals_train_label[animals_train_label == 5] = 3
-    animals_train_label[animals_train_label == 6] = 4
-    animals_train_label[animals_train_label == 7] = 5
-
-    cifar3_model = tf.keras.models.Sequential(
-        [tf.keras.layers.Conv2D(filters=32, kernel_size=(3, 3), activation='relu', input_shape=(32, 32, 3)),
-         tf.keras.layers.MaxPooling2D((2, 2)),
-         tf.keras.layers.Conv2D(filters=64, kernel_size=(3, 3), activation='relu'),
-         tf.keras.layers.MaxPooling2D((2, 2)),
-         tf.keras.layers.Flatten(),
-         tf.keras.layers.Dense(256, activation='relu'),
-         tf.keras.layers.Dense(6, activation='softmax')
-         ])
-    cifar3_model.compile(optimizer='adam',
-                         loss='sparse_categorical_crossentropy',
-                         metrics=['accuracy']
-                         )
-    cifar3_model.fit(animals_train_data, animals_train_label, epochs=5)
-
-    print("====================\nAnimals from CIFAR10 classifying [10] tests (2nd approach)\n====================")
-    cifar10_data2 = tf.keras.datasets.cifar10
-    (c2_train_data, c2_train_label), (c2_test_data, c2_test_label) = cifar10_data2.load_data()
-    c2_train_data = c2_train_data / 255
-    c2_test_data = c2_test_data / 255
-
-    bird2_index = np.where(c_train_label.reshape(-1) == 2)
-    bird2_data = c2_train_data[bird2_index]
-    bird2_label = c2_train_label[bird2_index]
-
-    cat2_index = np.where(c2_train_label.reshape(-1) == 3)
-    cat2_data = c2_train_data[cat2_index]
-    cat2_label = c2_train_label[cat2_index]
-
-    deer2_index = np.where(c_train_label.reshape(-1) == 4)
-    deer2_data = c2_train_data[deer2_index]
-    deer2_label = c2_train_label[deer2_index]
-
-    dog2_index = np.where(c2_train_label.reshape(-1) == 5)
-    dog2_data = c2_train_data[dog2_index]
-    dog2_label = c2_train_label[dog2_index]
-
-    frog2_index = np.where(c2_train_label.reshape(-1) == 6)
-    frog2_data = c2_train_data[frog2_index]
-    frog2_label = c2_train_label[frog2_index]
-
-    horse2_index = np.where(c2_train_label.reshape(-1) == 7)
-    horse2_data = c2_train_data[horse2_index]
-    horse2_label = c2_train_label[horse2_index]
-
-    animals2_train_data = np.concatenate((bird2_data, cat2_data, deer2_data, dog2_data, frog2_data, horse2_data))
-    animals2_train_label = np.concatenate(
-        (bird2_label, cat2_label, deer2_label, dog2_label, frog2_label, horse2_label)).reshape(-1, 1)
-    animals2_train_label[animals2_train_label == 2] = 0
-    animals2_train_label[animals2_train_label == 3] = 1
-    animals2_train_label[animals2_train_label == 4] = 2
-    animals2_train_label[animals2_train_label == 5] = 3
-    animals2_train_label[animals2_train_label == 6] = 4
-    animals2_train_label[animals2_train_label == 7] = 5
-
-    cifar32_model = tf.keras.models.Sequential(
-        [tf.keras.layers.Conv2D(filters=32, kernel_size=(3, 3), activation='relu', input_shape=(32, 32, 3)),
-         tf.keras.layers.MaxPooling2D((2, 2)),
-         tf.keras.layers.Conv2D(filters=64, kernel_size=(3, 3), activation='relu'),
-         tf.keras.layers.MaxPooling2D((2, 2)),
-         tf.keras.layers.Flatten(),
-         tf.keras.layers.Dense(256, activation='relu'),
-         tf.keras.layers.Dense(6, activation='softmax')
-         ])
-    cifar32_model.compile(optimizer='adam',
-                          loss='sparse_categorical_crossentropy',
-                          metrics=['accuracy']
-                          )
-    cifar32_model.fit(animals2_train_data, animals2_train_label, epochs=10)
-
-    """
-        10 Types of Clothes classifying.
-    """
-    print("====================\n10 Types of Clothes classifying\n====================")
-    clothes_data = tf.keras.datasets.fashion_mnist
-    (clothes_train_data, clothes_train_label), (clothes_test_data, clothes_test_label) = clothes_data.load_data()
-    clothes_train_data = clothes_train_data / 255.0
-    clothes_test_data = clothes_test_data / 255.0
-
-    clothes_model = tf.keras.Sequential([tf.keras.layers.Flatten(input_shape=(28, 28)),
-                                         tf.keras.layers.Dense(128, activation='relu'),
-                                         tf.keras.layers.Dense(10, activation='softmax')
-                                         ])
-    clothes_model.compile(optimizer='adam',
-                          loss='sparse_categorical_crossentropy',
-                          metrics=['accuracy']
-                          )
-    clothes_model.fit(clothes_train_data, clothes_train_label, epochs=10)
-
-    """
-        Phoneme authentication classifying
-    """
-    print("====================\nPhoneme authentication\n====================")
-    phoneme_data = pd.read_csv('phoneme.csv', names=['var1', 'var2', 'var3', 'var4', 'var5', 'class'])
-    phoneme_train_data = phoneme_data.copy()
-    phoneme_train_label = phoneme_data.pop('class')
-    phoneme_train_data = np.array(phoneme_train_data)
-
-    phoneme_model = tf.keras.Sequential([tf.keras.layers.Dense(64, activation='relu'),
-                                         tf.keras.layers.Dense(1)
-                                         ])
-    phoneme_model.compile(optimizer='adam',
-                          loss='mean_squared_error',
-                          metrics=['accuracy']
-                          )
-    phoneme_model.fit(phoneme_train_data, phoneme_train_label, epochs=3)
+    figure.savefig(path)
+    plt.close(figure)
+
+
+def run_experiment(name, output_dir='experiments', threads=None):
+    """
+    Train one experiment (in the process of its group). Model is saved after every epoch and training is resumed
+    from the last saved epoch when the experiment is run again
+
+    Params:
+    name: name of experiment in EXPERIMENTS
+    output_dir: directory for checkpoints, confusion matrices and summary
+    threads: number of TensorFlow threads of this process, default by TensorFlow
+
+    Returns: summary dict: accuracy, epochs trained in this run, epochs per second, peak RSS of the process in MB
+    and growth of the peak during this experiment (earlier experiments of the group run in the same process)
+    """
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    experiment = EXPERIMENTS[name]
+    experiment_dir = os.path.join(output_dir, name)
+    os.makedirs(experiment_dir, exist_ok=True)
+    checkpoint_file = os.path.join(experiment_dir, 'model.keras')
+    state_file = os.path.join(experiment_dir, 'state.json')
+
+    initial_epoch = 0
+    if os.path.exists(state_file) and os.path.exists(checkpoint_file):
+        with open(state_file, 'r', encoding='UTF8') as f:
+            initial_epoch = json.load(f)['epoch']
+        model = tf.keras.models.load_model(checkpoint_file)
+    else:
+        model = experiment['model'](*experiment.get('model_args', ()))
+
+    def save_checkpoint(epoch, logs):
+        """
+        Files are written under temporary names and renamed, so process killed while saving leaves
+        the previous checkpoint complete. State is replaced after the model, so it never points to epoch
+        which is not saved
+        """
+        model.save(checkpoint_file + '.tmp.keras')
+        os.replace(checkpoint_file + '.tmp.keras', checkpoint_file)
+        with open(state_file + '.tmp', 'w', encoding='UTF8') as f:
+            json.dump({'epoch': epoch + 1}, f)
+        os.replace(state_file + '.tmp', state_file)
+
+    callbacks = [tf.keras.callbacks.LambdaCallback(on_epoch_end=save_checkpoint)]
+    start = time.perf_counter()
+    if initial_epoch < experiment['epochs']:
+        model.fit(experiment_dataset(experiment, 'train', True), epochs=experiment['epochs'],
+                  initial_epoch=initial_epoch, callbacks=callbacks)
+    train_time = time.perf_counter() - start
+    epochs = experiment['epochs'] - initial_epoch
+
+    split = evaluation_split(experiment)
+    _, accuracy = model.evaluate(experiment_dataset(experiment, split, False))
+    if 'class_names' in experiment:
+        save_confusion_matrix(model, experiment_dataset(experiment, split, False),
+                              get_dataset(experiment['dataset'], split)[1], experiment['class_names'],
+                              os.path.join(experiment_dir, 'confusion_matrix.png'))
+    summary = {'experiment': name, 'accuracy': float(accuracy), 'evaluated_on': split, 'epochs': epochs,
+               'resumed_from_epoch': initial_epoch, 'epochs_per_second': epochs / train_time if epochs else None,
+               'group_peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+               'peak_rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024}
+    """kept on disk, so the summary survives when a later experiment kills the process"""
+    with open(os.path.join(experiment_dir, 'summary.json'), 'w', encoding='UTF8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def run_experiment_group(names, output_dir='experiments', threads=None):
+    """
+    Run experiments one after another in this process, so data set shared by them is loaded only once.
+    Exception in one experiment does not stop the others
+
+    Returns: list of summaries (with 'error' for failed experiments)
+    """
+    summaries = []
+    for name in names:
+        try:
+            summaries.append(run_experiment(name, output_dir, threads))
+        except Exception as e:
+            summaries.append({'experiment': name, 'error': repr(e)})
+    return summaries
+
+
+def run_group_process(names, output_dir='experiments', threads=None):
+    """
+    Run group of experiments in a new spawned process with its own TensorFlow runtime. When the process dies
+    (out of memory, crash of TensorFlow) summaries of experiments finished before are read from their
+    directories and the rest is recorded as failed
+
+    Returns: list of summaries
+    """
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'),
+                                                max_tasks_per_child=1) as executor:
+        try:
+            return executor.submit(run_experiment_group, names, output_dir, threads).result()
+        except concurrent.futures.process.BrokenProcessPool as e:
+            error = repr(e)
+    summaries = []
+    for name in names:
+        summary_file = os.path.join(output_dir, name, 'summary.json')
+        if os.path.exists(summary_file):
+            with open(summary_file, 'r', encoding='UTF8') as f:
+                summaries.append(json.load(f))
+        else:
+            summaries.append({'experiment': name, 'error': error})
+    return summaries
+
+
+def run_experiments(names, jobs=1, threads=None, output_dir='experiments'):
+    """
+    Run experiments in separate processes, experiments sharing a data set (e.g. cifar10, animals and
+    animals_10_epochs) run in the same process. Every group has its own process pool, so failure or death
+    of one process does not stop the others. Summary is written to output_dir/summary.json
+
+    Params:
+    names: names of experiments
+    jobs: number of processes run at the same time
+    threads: number of TensorFlow threads of every process
+    output_dir: directory for checkpoints and summary
+
+    Returns: list of summaries in order of names
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    groups = {}
+    for name in names:
+        groups.setdefault(EXPERIMENTS[name]['dataset'], []).append(name)
+        """summary left by previous run must not be taken for a result of this one"""
+        summary_file = os.path.join(output_dir, name, 'summary.json')
+        if os.path.exists(summary_file):
+            os.remove(summary_file)
+    """threads only wait for processes, peak RSS and thread limits are per group process"""
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        results = executor.map(lambda group: run_group_process(group, output_dir, threads), groups.values())
+        by_name = {summary['experiment']: summary for group in results for summary in group}
+    summaries = [by_name[name] for name in names]
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='UTF8') as f:
+        json.dump(summaries, f, indent=2)
+    return summaries
+
+
+def build_arg_parser():
+    """
+    Enables to choose experiments and runner options
+
+    Returns: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Neural network experiments')
+    parser.add_argument('experiments', nargs='*', metavar='EXPERIMENT',
+                        help=f"Experiments to run: {', '.join(EXPERIMENTS)} (default: all)")
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes run at the same time')
+    parser.add_argument('--threads', type=int, default=None, help='Number of TensorFlow threads of every experiment')
+    parser.add_argument('--output', default='experiments', help='Directory for checkpoints and summary')
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    unknown = [name for name in args.experiments if name not in EXPERIMENTS]
+    if unknown:
+        parser.error(f"unknown experiments: {', '.join(unknown)}")
+    for summary in run_experiments(args.experiments or list(EXPERIMENTS), args.jobs, args.threads, args.output):
+        if 'error' in summary:
+            print(f"{summary['experiment']}: failed with {summary['error']}")
+            continue
+        speed = f"{summary['epochs_per_second']:.2f} epochs/s" if summary['epochs'] else "already trained"
+        print(f"{summary['experiment']}: accuracy {summary['accuracy']:.3f} ({summary['evaluated_on']}), "
+              f"{speed}, peak RSS {summary['group_peak_rss_mb']:.0f} MB "
+              f"(+{summary['peak_rss_growth_mb']:.0f} MB in this experiment)")
@@ -0,0 +1,200 @@
+import argparse
+import gc
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from main import MATCH_IOU, FaceDetector, FrameBuffers, analyze_frame, box_iou, detect_frame, load_face_cascade
+
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Benchmark of processing scales over a video file: detection FPS and agreement of found faces and green things
+with detection on full resolution frames (F1 score of matched detections).
+
+How to run:
+- execute `python benchmark.py [--video python_gaNtHwMixw.mp4] [--scales 1 0.75 0.5 0.35] [--full-sweep-every 1 10]`
+- per-frame memory churn and garbage collection with and without reused buffers:
+  `python benchmark.py --allocations [--scales 1 0.5]`
+"""
+
+BLOB_DISTANCE = 15
+
+
+def read_frames(video, max_frames=None):
+    """
+    Returns: list of video frames (read before measuring, so decoding is not measured)
+    """
+    vid = cv2.VideoCapture(video)
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = vid.read()
+        if not ret:
+            break
+        frames.append(frame)
+    vid.release()
+    return frames
+
+
+def detect_video(frames, face_cascade, scale, full_sweep_every):
+    """
+    Returns: faces and green things found on every frame and detection FPS
+    """
+    face_detector = FaceDetector(face_cascade, scale, full_sweep_every)
+    detections = []
+    start = time.perf_counter()
+    for frame in frames:
+        faces, blobs = detect_frame(frame, face_detector, scale=scale)
+        detections.append(([face[1:] for face in faces], blobs))
+    return detections, len(frames) / (time.perf_counter() - start)
+
+
+def f1_score(reference, found, matches):
+    """
+    Greedy matching of found detections with reference detections of every frame
+
+    Returns: F1 score (1.0 when both are empty)
+    """
+    true_positives = reference_count = found_count = 0
+    for reference_items, found_items in zip(reference, found):
+        unmatched = list(found_items)
+        for item in reference_items:
+            match = next((other for other in unmatched if matches(item, other)), None)
+            if match is not None:
+                unmatched.remove(match)
+                true_positives += 1
+        reference_count += len(reference_items)
+        found_count += len(found_items)
+    return 2 * true_positives / (reference_count + found_count) if reference_count + found_count else 1.0
+
+
+def benchmark(video, scales, sweeps, max_frames=None):
+    """
+    Print FPS and agreement with full resolution detection (scale 1, full sweep every frame) for every configuration
+    """
+    frames = read_frames(video, max_frames)
+    face_cascade = load_face_cascade()
+    reference, reference_fps = detect_video(frames, face_cascade, 1.0, 1)
+    print(f"{len(frames)} frames {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"{'scale':>6} {'sweep':>6} {'FPS':>8} {'speedup':>8} {'faces F1':>9} {'colors F1':>10}")
+    for scale in scales:
+        for full_sweep_every in sweeps:
+            if scale == 1.0 and full_sweep_every == 1:
+                detections, fps = reference, reference_fps
+            else:
+                detections, fps = detect_video(frames, face_cascade, scale, full_sweep_every)
+            faces_f1 = f1_score([faces for faces, _ in reference], [faces for faces, _ in detections],
+                                lambda a, b: box_iou(a, b) >= MATCH_IOU)
+            blobs_f1 = f1_score([blobs for _, blobs in reference], [blobs for _, blobs in detections],
+                                lambda a, b: np.hypot(a[0] - b[0], a[1] - b[1]) <= BLOB_DISTANCE)
+            print(f"{scale:>6} {full_sweep_every:>6} {fps:>8.1f} {fps / reference_fps:>7.2f}x "
+                  f"{faces_f1:>9.3f} {blobs_f1:>10.3f}")
+
+
+class GCTimer:
+    """
+    Counts garbage collections and their time using gc callbacks
+    """
+
+    def __init__(self):
+        self.collections = 0
+        self.time = 0.0
+        self.started_at = None
+
+    def __call__(self, phase, info):
+        if phase == 'start':
+            self.started_at = time.perf_counter()
+        elif self.started_at is not None:
+            self.collections += 1
+            self.time += time.perf_counter() - self.started_at
+
+    def __enter__(self):
+        gc.callbacks.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        gc.callbacks.remove(self)
+
+
+def measure_allocations(frames, face_cascade, scale, reuse_buffers, warm_up=10):
+    """
+    Analyze frames (detection and drawing) twice: once measuring time and garbage collections, once measuring
+    with tracemalloc how much memory is allocated on top of already allocated memory during every frame
+
+    Returns: time per frame, allocated bytes per frame, garbage collections per 1000 frames, gc time per frame
+    """
+    def run(measure_frame):
+        face_detector = FaceDetector(face_cascade, scale)
+        buffers = FrameBuffers() if reuse_buffers else None
+        result = np.empty_like(frames[0]) if reuse_buffers else None
+        for i, frame in enumerate(frames):
+            measure_frame(i >= warm_up, lambda: analyze_frame(frame, face_detector, None, scale, buffers, result))
+
+    elapsed = []
+    with GCTimer() as gc_timer:
+        def timed(measured, analyze):
+            start = time.perf_counter()
+            analyze()
+            if measured:
+                elapsed.append(time.perf_counter() - start)
+        run(timed)
+
+    allocated = []
+    tracemalloc.start()
+
+    def traced(measured, analyze):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        analyze()
+        if measured:
+            allocated.append(tracemalloc.get_traced_memory()[1] - current)
+    try:
+        run(traced)
+    finally:
+        tracemalloc.stop()
+    frames_count = len(frames)
+    return (np.mean(elapsed), np.mean(allocated), gc_timer.collections * 1000 / frames_count,
+            gc_timer.time / frames_count)
+
+
+def benchmark_allocations(video, scales, max_frames=None):
+    """
+    Print memory churn and garbage collection overhead per frame with new images for every frame
+    and with reused buffers
+    """
+    frames = read_frames(video, max_frames)
+    face_cascade = load_face_cascade()
+    print(f"{'scale':>6} {'buffers':>8} {'ms/frame':>9} {'kB allocated/frame':>19} {'GCs/1000 frames':>16} "
+          f"{'GC ms/frame':>12}")
+    for scale in scales:
+        for reuse_buffers in (False, True):
+            frame_time, allocated, collections, gc_time = measure_allocations(frames, face_cascade, scale,
+                                                                              reuse_buffers)
+            print(f"{scale:>6} {'reused' if reuse_buffers else 'new':>8} {frame_time * 1000:>9.2f} "
+                  f"{allocated / 1024:>19.1f} {collections:>16.1f} {gc_time * 1000:>12.4f}")
+
+
+def build_arg_parser():
+    """
+    Enables to choose video and configurations
+
+    Returns: argument parser
+    """
+    parser = argparse.ArgumentParser(description='Benchmark of processing scales')
+    parser.add_argument('--video', default='python_gaNtHwMixw.mp4', help='Video file')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.35], help='Processing scales')
+    parser.add_argument('--full-sweep-every', dest='sweeps', type=int, nargs='+', default=[1, 10],
+                        help='Frames between face searches of the whole frame')
+    parser.add_argument('--max-frames', dest='max_frames', type=int, default=None, help='Use only first frames')
+    parser.add_argument('--allocations', action='store_true',
+                        help='Measure per-frame allocations and garbage collection instead of scales')
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    if args.allocations:
+        benchmark_allocations(args.video, args.scales, args.max_frames)
+    else:
+        benchmark(args.video, args.scales, args.sweeps, args.max_frames)
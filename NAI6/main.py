@@ -1,3 +1,12 @@
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import deque
 import cv2
 import numpy as np
 
@@ -9,107 +18,762 @@ System requirements:
 - Python
 - Numpy
 - OpenCV
-"""
 
-"""
-Define a video capture object
-"""
-vid = cv2.VideoCapture(0)
+How to run:
+- camera: `python main.py`
+- video file: `python main.py --source python_gaNtHwMixw.mp4 [--realtime] [--headless] [--queue-size 1]`
+- detect-then-track: `python main.py --track [--detect-every 10] [--min-confidence 0.5]`, face detection runs only
+  every N frames (or when tracking gets unreliable), between detections faces are followed with optical flow
+- downscaled detection: `python main.py --scale 0.5 [--full-sweep-every 10] [--min-face 40] [--max-face 400]`,
+  faces and colors are searched on downscaled frame (only around previous faces between full sweeps)
+  and found positions are scaled back to the original frame
+- benchmark of processing scales: `python benchmark.py [--scales 1 0.75 0.5 0.35] [--full-sweep-every 1 10]`
+- per-frame allocations with and without reused buffers: `python benchmark.py --allocations`
+- offline video analysis without windows: `python main.py --input VIDEO --output detections.jsonl [--workers N]
+  [--shards N] [--annotated annotated.mp4]`, the video is split into frame ranges processed in parallel processes,
+  detections of every frame (in time order) are written as json lines
 
+Capture, analysis and rendering run on separate threads connected with bounded queues which drop the oldest
+frame when full, so analysis always works on the newest frame. Frames per second and latency (time since capture)
+of every stage are printed at the end.
 """
-Load the face cascade classifier
-"""
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 
+ESC_KEY = 27
+MATCH_IOU = 0.3
+HAAR_WINDOW = 24
+MIN_CONTOUR_SIZE = 200
 """
-Check if the face cascade classifier is loaded
+Define color range to find red
 """
-if face_cascade.empty():
-    raise IOError("Unable to load the face cascade classifier.")
+GREEN_LOWER = np.array([36, 25, 25], dtype=np.uint8)
+GREEN_UPPER = np.array([70, 255, 255], dtype=np.uint8)
+
+
+class LatestQueue:
+    """
+    Bounded queue which drops the oldest item when it is full
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        """
+        Params:
+        maxsize: maximal number of items
+        on_drop: function called with dropped item
+        """
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put(self, item):
+        """
+        Add item without blocking, the oldest item is dropped when queue is full
+        """
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(self.items[0])
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self):
+        """
+        Wait for item
+
+        Returns: the oldest item in queue, None when queue is closed and empty
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed)
+            return self.items.popleft() if self.items else None
 
-while True:
+    def close(self):
+        """
+        No more items will be added
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class StageStats:
     """
-    Capture the video frame by frame
+    Frames per second and latency (time since frame capture) of one pipeline stage
     """
-    ret, frame = vid.read()
-    result = frame.copy()
 
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.start = self.end = None
+
+    def record(self, captured_at):
+        """
+        Count frame finished by the stage now
+        """
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        self.end = now
+        self.frames += 1
+        self.total_latency += now - captured_at
+        self.max_latency = max(self.max_latency, now - captured_at)
+
+    def fps(self):
+        return (self.frames - 1) / (self.end - self.start) if self.frames > 1 and self.end > self.start else 0.0
+
+    def __str__(self):
+        average = self.total_latency / self.frames if self.frames else 0.0
+        return (f"{self.name}: {self.frames} frames, {self.fps():.1f} FPS, "
+                f"latency avg {average * 1000:.1f} ms, max {self.max_latency * 1000:.1f} ms")
+
+
+class BufferPool:
     """
-    Change video to another color scale
+    Frame buffers passed between stages, buffers are given back when frame is rendered or dropped,
+    so after first frames no new frame is allocated
+    """
+
+    def __init__(self):
+        self.free = []
+        self.lock = threading.Lock()
+        self.allocated = 0
+
+    def acquire(self, shape):
+        """
+        Returns: free buffer, new one only if there is no free buffer
+        """
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, *buffers):
+        with self.lock:
+            self.free.extend(buffers)
+
+
+class FrameBuffers:
+    """
+    Images of analysis reused for every frame, allocated for the first frame (again only if frame size changes)
+    """
+
+    def __init__(self):
+        self.key = None
+
+    def prepare(self, frame, scale):
+        """
+        Allocate buffers for frame size and processing scale if they are not allocated yet
+        """
+        if self.key == (frame.shape, scale):
+            return
+        height, width = frame.shape[:2]
+        self.size = (width, height) if scale == 1 else (max(1, round(width * scale)), max(1, round(height * scale)))
+        self.small = None if scale == 1 else np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.gray = np.empty((self.size[1], self.size[0]), dtype=np.uint8)
+        self.hsv = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.mask = np.empty((self.size[1], self.size[0]), dtype=np.uint8)
+        self.key = (frame.shape, scale)
+
+
+def load_face_cascade():
+    """
+    Load the face cascade classifier
+    """
+    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    """
+    Check if the face cascade classifier is loaded
+    """
+    if face_cascade.empty():
+        raise IOError("Unable to load the face cascade classifier.")
+    return face_cascade
+
+
+def box_iou(a, b):
+    """
+    Returns: intersection over union of two (x, y, w, h) boxes
     """
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    width = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    height = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (a[2] * a[3] + b[2] * b[3] - intersection)
 
+
+class FaceDetector:
+    """
+    Haar cascade face detection which searches only regions around previously found faces, the whole frame
+    is searched every full_sweep_every frames and whenever no face was found. Face size limits are given
+    in pixels of full resolution frame and converted to processing scale
+    """
+
+    def __init__(self, face_cascade, scale=1.0, full_sweep_every=1, margin=0.5, min_face=None, max_face=None):
+        """
+        Params:
+        face_cascade: face cascade classifier
+        scale: processing scale of frames given to detectMultiScale
+        full_sweep_every: number of frames between searches of the whole frame (1 - always whole frame)
+        margin: region around previous face is bigger by margin * face size on every side
+        min_face: minimal face size in full resolution pixels
+        max_face: maximal face size in full resolution pixels
+        """
+        self.face_cascade = face_cascade
+        self.full_sweep_every = full_sweep_every
+        self.margin = margin
+        """Haar window is 24x24, so faces smaller than 24 / scale full resolution pixels are never found"""
+        self.min_size = (max(HAAR_WINDOW, round((min_face or 0) * scale)),) * 2
+        """(0, 0) means no maximal size for detectMultiScale"""
+        self.max_size = (max(self.min_size[0], round(max_face * scale)),) * 2 if max_face else (0, 0)
+        self.previous = []
+        self.frames_since_sweep = 0
+        self.full_sweeps = 0
+
+    def detectMultiScale(self, gray_frame, scaleFactor=1.3, minNeighbors=5):
+        """
+        Same interface as cascade classifier, so the detector can be used by FaceTracker
+
+        Returns: array of (x, y, w, h) faces
+        """
+        if not self.previous or self.frames_since_sweep + 1 >= self.full_sweep_every:
+            self.frames_since_sweep = 0
+            self.full_sweeps += 1
+            faces = [tuple(face) for face in self.face_cascade.detectMultiScale(
+                gray_frame, scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                minSize=self.min_size, maxSize=self.max_size)]
+        else:
+            self.frames_since_sweep += 1
+            height, width = gray_frame.shape[:2]
+            faces = []
+            for x, y, w, h in self.previous:
+                x0, y0 = max(0, int(x - w * self.margin)), max(0, int(y - h * self.margin))
+                x1, y1 = min(width, int(x + w * (1 + self.margin))), min(height, int(y + h * (1 + self.margin)))
+                for fx, fy, fw, fh in self.face_cascade.detectMultiScale(
+                        gray_frame[y0:y1, x0:x1], scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                        minSize=self.min_size, maxSize=self.max_size):
+                    face = (fx + x0, fy + y0, fw, fh)
+                    """regions of close faces overlap, the same face is kept once"""
+                    if all(box_iou(face, other) < MATCH_IOU for other in faces):
+                        faces.append(face)
+        self.previous = [tuple(int(value) for value in face) for face in faces]
+        return np.array(self.previous, dtype=np.int32).reshape(-1, 4)
+
+
+class FaceTracker:
     """
-    Detect faces
+    Detect-then-track: Haar cascade runs every detect_every frames or when tracking confidence drops,
+    between detections faces are followed with Lucas-Kanade optical flow of corner points inside face boxes.
+    Faces matched with previous tracks (by overlap) keep their ids
     """
-    face_rects = face_cascade.detectMultiScale(gray_frame, scaleFactor=1.3, minNeighbors=5)
 
+    def __init__(self, face_cascade, detect_every=10, min_confidence=0.5, min_points=5):
+        """
+        Params:
+        face_cascade: face cascade classifier (or FaceDetector)
+        detect_every: number of frames between detections
+        min_confidence: detection is run when fraction of points still tracked in any face is lower
+        min_points: detection is run when any face has less tracked points
+        """
+        self.face_cascade = face_cascade
+        self.detect_every = detect_every
+        self.min_confidence = min_confidence
+        self.min_points = min_points
+        self.tracks = []
+        self.previous_gray = None
+        self.frames_since_detection = 0
+        self.next_id = 0
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, gray_frame):
+        """
+        Follow faces to the new frame, detect them again if it is time or tracking is not confident
+
+        Returns: list of (track id, x, y, w, h)
+        """
+        self.frames += 1
+        if self.previous_gray is not None and self.previous_gray.shape != gray_frame.shape:
+            self.previous_gray, self.tracks = None, []
+        confident = self._track(gray_frame) if self.previous_gray is not None else False
+        if not confident or self.frames_since_detection + 1 >= self.detect_every:
+            self._detect(gray_frame)
+        else:
+            self.frames_since_detection += 1
+        """gray frame buffer is reused for the next frame, so it is copied to own buffer"""
+        if self.previous_gray is None:
+            self.previous_gray = np.empty_like(gray_frame)
+        np.copyto(self.previous_gray, gray_frame)
+        return [(track['id'], *np.round(track['box']).astype(int)) for track in self.tracks]
+
+    def _track(self, gray_frame):
+        """
+        Move every face box by median shift of its points, scale it by median change of distances between points
+
+        Returns: False if any face lost too many points
+        """
+        confident = True
+        for track in self.tracks:
+            if len(track['points']) < self.min_points:
+                confident = False
+                continue
+            points, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray_frame, track['points'], None,
+                                                         winSize=(15, 15), maxLevel=2)
+            """forward-backward check drops points which do not return to their start"""
+            back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray_frame, self.previous_gray, points, None,
+                                                            winSize=(15, 15), maxLevel=2)
+            error = np.linalg.norm((track['points'] - back).reshape(-1, 2), axis=1)
+            good = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < 1.0)
+            if np.count_nonzero(good) < max(self.min_points, self.min_confidence * track['initial_points']):
+                confident = False
+            if np.count_nonzero(good) < 2:
+                continue
+
+            old, new = track['points'][good].reshape(-1, 2), points[good].reshape(-1, 2)
+            rows, cols = np.triu_indices(len(old), 1)
+            old_distances = np.linalg.norm(old[rows] - old[cols], axis=1)
+            valid = old_distances > 0
+            scale = np.median(np.linalg.norm(new[rows] - new[cols], axis=1)[valid] / old_distances[valid]) \
+                if np.any(valid) else 1.0
+            x, y, w, h = track['box']
+            center = np.array([x + w / 2, y + h / 2]) + np.median(new - old, axis=0)
+            track['box'] = np.array([center[0] - w * scale / 2, center[1] - h * scale / 2, w * scale, h * scale])
+            track['points'] = points[good]
+        return confident
+
+    def _detect(self, gray_frame):
+        """
+        Detect faces, match them with current tracks and pick points to track inside them
+        """
+        self.detections += 1
+        self.frames_since_detection = 0
+        face_rects = self.face_cascade.detectMultiScale(gray_frame, scaleFactor=1.3, minNeighbors=5)
+        tracks, used = [], set()
+        for rect in face_rects:
+            box = np.asarray(rect, dtype=np.float64)
+            overlaps = [(box_iou(track['box'], box), i) for i, track in enumerate(self.tracks) if i not in used]
+            overlap, match = max(overlaps, default=(0.0, None))
+            if match is not None and overlap >= MATCH_IOU:
+                used.add(match)
+                track_id = self.tracks[match]['id']
+            else:
+                track_id = self.next_id
+                self.next_id += 1
+            points = self._features(gray_frame, box)
+            tracks.append({'id': track_id, 'box': box, 'points': points, 'initial_points': len(points)})
+        self.tracks = tracks
+
+    @staticmethod
+    def _features(gray_frame, box):
+        """
+        Returns: corner points inside the middle of face box, shape (n, 1, 2)
+        """
+        x, y, w, h = box
+        x0, y0 = int(x + w * 0.15), int(y + h * 0.1)
+        x1, y1 = int(x + w * 0.85), int(y + h * 0.9)
+        points = cv2.goodFeaturesToTrack(gray_frame[y0:y1, x0:x1], maxCorners=50, qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return np.empty((0, 1, 2), dtype=np.float32)
+        return points + np.array([x0, y0], dtype=np.float32)
+
+
+def detect_frame(frame, face_detector, tracker=None, scale=1.0, buffers=None):
     """
-    Draw circle on faces
+    Find faces and big green things on frame downscaled to processing scale
+
+    Params:
+    frame: video frame
+    face_detector: FaceDetector (or cascade classifier), used on every frame when there is no tracker
+    tracker: FaceTracker for detect-then-track mode
+    scale: processing scale, frame is downscaled before detection
+    buffers: FrameBuffers reused between frames, new buffers are allocated without them
+
+    Returns: faces as list of (track id or None, x, y, w, h) and centres of green things, both in frame coordinates
     """
-    for (x, y, w, h) in face_rects:
-        center_coordinates = x + w // 2, y + h // 2
-        cv2.circle(result, center_coordinates, 10, (0, 0, 255), 20)
+    buffers = buffers or FrameBuffers()
+    buffers.prepare(frame, scale)
+    small_frame = frame if scale == 1 else cv2.resize(frame, buffers.size, dst=buffers.small,
+                                                      interpolation=cv2.INTER_AREA)
 
     """
-    Define color range to find red
+    Change video to another color scale
     """
-    lower = np.array([36, 25, 25])
-    upper = np.array([70, 255, 255])
+    gray_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY, dst=buffers.gray)
+    hsv = cv2.cvtColor(small_frame, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
 
     """
-    Create mask to show only red things
+    Detect (or track) faces, tracked faces have ids
     """
-    mask = cv2.inRange(hsv, lower, upper)
-    imask = mask > 0
-    green = np.zeros_like(frame, np.uint8)
-    green[imask] = frame[imask]
+    if tracker is None:
+        faces = [(None, *face) for face in face_detector.detectMultiScale(gray_frame, scaleFactor=1.3, minNeighbors=5)]
+    else:
+        faces = tracker.update(gray_frame)
+    faces = [(face_id, round(x / scale), round(y / scale), round(w / scale), round(h / scale))
+             for face_id, x, y, w, h in faces]
 
     """
-    Find contours
+    Create mask to show only red things and find contours
     """
+    mask = cv2.inRange(hsv, GREEN_LOWER, GREEN_UPPER, dst=buffers.mask)
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return faces, []
+
+    """
+    Keep contours which bounding box exceeds the minimum size threshold (in pixels of processing scale)
+    """
+    boxes = np.array([cv2.boundingRect(contour) for contour in contours])
+    boxes = boxes[boxes[:, 2] * boxes[:, 3] > MIN_CONTOUR_SIZE * scale * scale]
+    centers = ((boxes[:, :2] + boxes[:, 2:] / 2) / scale).astype(int)
+    return faces, [tuple(center) for center in centers.tolist()]
+
+
+def draw_detections(frame, faces, blobs, result=None):
+    """
+    Put circles on faces (red, with track ids) and on big green things (green)
+
+    Params:
+    frame: video frame
+    faces: faces from detect_frame
+    blobs: centres of green things from detect_frame
+    result: buffer for the result, new one is allocated without it
+
+    Returns: frame with circles
+    """
+    if result is None:
+        result = frame.copy()
+    else:
+        np.copyto(result, frame)
+    for face_id, x, y, w, h in faces:
+        cv2.circle(result, (x + w // 2, y + h // 2), 10, (0, 0, 255), 20)
+        if face_id is not None:
+            cv2.putText(result, str(face_id), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    for center in blobs:
+        cv2.circle(result, center, 10, (0, 255, 0), 20)
+    return result
+
+
+def analyze_frame(frame, face_detector, tracker=None, scale=1.0, buffers=None, result=None):
+    """
+    Detect faces and green things and draw them
+
+    Returns: frame with circles
+    """
+    return draw_detections(frame, *detect_frame(frame, face_detector, tracker, scale, buffers), result)
+
+
+def capture_stage(vid, pool, frames, stats, stop, errors, realtime=False):
+    """
+    Read frames into pool buffers until the video ends or stop is set,
+    with realtime video file is read at its own FPS. Exception is appended to errors
+    """
+    fps = vid.get(cv2.CAP_PROP_FPS)
+    interval = 1 / fps if realtime and fps > 0 else 0
+    next_frame_at = time.perf_counter()
+    index = 0
+    shape = None
+    """queue is closed also on error, otherwise the next stage would wait forever"""
+    try:
+        while not stop.is_set():
+            buffer = pool.acquire(shape) if shape else None
+            ret, frame = vid.read(buffer)
+            if not ret:
+                break
+            shape = frame.shape
+            captured_at = time.perf_counter()
+            stats.record(captured_at)
+            frames.put((index, captured_at, frame))
+            index += 1
+            if interval:
+                next_frame_at += interval
+                time.sleep(max(0.0, next_frame_at - time.perf_counter()))
+    except Exception as e:
+        errors.append(e)
+    finally:
+        frames.close()
+
+
+def analysis_stage(face_detector, tracker, scale, pool, frames, results, stats, errors):
+    """
+    Analyze the newest captured frames until capture ends. Exception is appended to errors
+    """
+    buffers = FrameBuffers()
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            index, captured_at, frame = item
+            result = analyze_frame(frame, face_detector, tracker, scale, buffers, pool.acquire(frame.shape))
+            stats.record(captured_at)
+            results.put((index, captured_at, frame, result))
+    except Exception as e:
+        errors.append(e)
+    finally:
+        results.close()
+
+
+def run_pipeline(source=0, queue_size=1, headless=False, realtime=False, detect_every=None, min_confidence=0.5,
+                 scale=1.0, full_sweep_every=1, min_face=None, max_face=None):
+    """
+    Run capture and analysis threads, show results in this thread (OpenCV windows have to be used by one thread)
+
+    Params:
+    source: camera index or video file
+    queue_size: size of queues between stages
+    headless: do not show windows
+    realtime: read video file at its own FPS instead of as fast as possible
+    detect_every: if given, faces are detected every detect_every frames and tracked between detections
+    min_confidence: fraction of tracked points below which faces are detected again
+    scale: processing scale, frames are downscaled before detection
+    full_sweep_every: number of frames between face searches of the whole frame
+    min_face: minimal face size in pixels
+    max_face: maximal face size in pixels
+
+    Raises: exception of capture or analysis stage after the pipeline is stopped
+
+    Returns: stats of capture, analysis and render stages, numbers of frames dropped by both queues,
+    the tracker (None without tracking) and number of allocated frame buffers
+    """
+    """
+    Define a video capture object
+    """
+    vid = cv2.VideoCapture(source)
+    if not vid.isOpened():
+        raise IOError(f"Unable to open video source {source}.")
+    face_detector = FaceDetector(load_face_cascade(), scale, full_sweep_every, min_face=min_face, max_face=max_face)
+    tracker = FaceTracker(face_detector, detect_every, min_confidence) if detect_every else None
 
     """
-    Set a minimum size threshold for contours
+    Frames and results go back to the pool after rendering or when they are dropped
     """
-    min_contour_size = 200
+    pool = BufferPool()
+    frames = LatestQueue(queue_size, on_drop=lambda item: pool.release(item[2]))
+    results = LatestQueue(queue_size, on_drop=lambda item: pool.release(item[2], item[3]))
+    stats = [StageStats('capture'), StageStats('analysis'), StageStats('render')]
+    stop = threading.Event()
+    errors = []
+    threads = [threading.Thread(target=capture_stage, args=(vid, pool, frames, stats[0], stop, errors, realtime),
+                                daemon=True),
+               threading.Thread(target=analysis_stage,
+                                args=(face_detector, tracker, scale, pool, frames, results, stats[1], errors),
+                                daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                break
+            index, captured_at, frame, result = item
+            if not headless:
+                """
+                Show original video and the one with the mask
+                """
+                cv2.imshow("Original Video", frame)
+                cv2.imshow('Result', result)
+
+                """
+                Close the video if the ESC key is pressed
+                """
+                if cv2.waitKey(1) == ESC_KEY:
+                    break
+            stats[2].record(captured_at)
+            pool.release(frame, result)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
 
-    if contours:
         """
-        Iterate through the contours and draw bounding boxes only for large contours
+        Release the video capture object
         """
-        for contour in contours:
-            """
-            Calculate bounding box parameters
-            """
-            x, y, w, h = cv2.boundingRect(contour)
+        vid.release()
+
+        """
+        Destroy all windows
+        """
+        if not headless:
+            cv2.destroyAllWindows()
+    """failure of a stage ends the pipeline like the end of video, so it is raised here"""
+    if errors:
+        raise errors[0]
+    return stats, frames.dropped, results.dropped, tracker, pool.allocated
+
+
+def process_range(input_file, output_file, start, end, shard, options, annotated_file=None):
+    """
+    Analyze frames [start, end) of video file in this process (own cascade and capture seeking to start)
 
-            """
-            Check if the contour size exceeds the minimum threshold
-            """
-            if w * h > min_contour_size:
-                cv2.circle(result, (x + w // 2, y + h // 2), 10, (0, 255, 0), 20)
+    Params:
+    input_file: video file
+    output_file: json lines file for detections of this range
+    start: first frame
+    end: frame after the last one, None - to the end of video
+    shard: number of range, prefix of track ids
+    options: dict with scale, full_sweep_every, min_face, max_face, detect_every, min_confidence
+    annotated_file: video file for frames with circles of this range
 
+    Returns: number of analyzed frames
     """
-    Show original video and the one with the mask
+    cv2.setNumThreads(1)
+    vid = cv2.VideoCapture(input_file)
+    vid.set(cv2.CAP_PROP_POS_FRAMES, start)
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30.0
+    scale = options['scale']
+    face_detector = FaceDetector(load_face_cascade(), scale, options['full_sweep_every'],
+                                 min_face=options['min_face'], max_face=options['max_face'])
+    tracker = FaceTracker(face_detector, options['detect_every'], options['min_confidence']) \
+        if options['detect_every'] else None
+    buffers = FrameBuffers()
+    frame = result = writer = None
+    index = start
+    with open(output_file, 'w', encoding='UTF8') as f:
+        while end is None or index < end:
+            ret, frame = vid.read(frame)
+            if not ret:
+                break
+            faces, blobs = detect_frame(frame, face_detector, tracker, scale, buffers)
+            f.write(json.dumps({'frame': index, 'time': round(index / fps, 3),
+                                'faces': [{'id': None if face_id is None else f'{shard}.{face_id}', 'box': box}
+                                          for face_id, *box in faces],
+                                'colors': blobs}) + '\n')
+            if annotated_file:
+                if writer is None:
+                    writer = cv2.VideoWriter(annotated_file, cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                                             (frame.shape[1], frame.shape[0]))
+                result = draw_detections(frame, faces, blobs, result)
+                writer.write(result)
+            index += 1
+    vid.release()
+    if writer is not None:
+        writer.release()
+    return index - start
+
+
+def run_offline(input_file, output_file, workers=None, shards=None, annotated_file=None, scale=1.0,
+                full_sweep_every=1, min_face=None, max_face=None, detect_every=None, min_confidence=0.5):
     """
-    cv2.imshow("Original Video", frame)
-    cv2.imshow('Result', result)
+    Analyze video file without windows: frame ranges are processed in a process pool, their detections
+    are merged in time order into json lines file
+
+    Params:
+    input_file: video file
+    output_file: json lines file, one line per frame: {"frame", "time", "faces": [{"id", "box"}], "colors"}
+    workers: number of processes, all cores by default
+    shards: number of frame ranges, number of workers by default
+    annotated_file: if given, video with circles is written too
+    other params as in run_pipeline
+
+    Returns: number of analyzed frames, duration of video in seconds and processing time in seconds
+    """
+    vid = cv2.VideoCapture(input_file)
+    if not vid.isOpened():
+        raise IOError(f"Unable to open video source {input_file}.")
+    frame_count = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30.0
+    vid.release()
+
+    workers = workers or os.cpu_count()
+    shards = max(1, min(shards or workers, frame_count))
+    size = math.ceil(frame_count / shards)
+    """the last range is read to the end, because frame count of some videos is only estimated"""
+    ranges = [(shard * size, (shard + 1) * size if shard < shards - 1 else None) for shard in range(shards)]
+    options = {'scale': scale, 'full_sweep_every': full_sweep_every, 'min_face': min_face, 'max_face': max_face,
+               'detect_every': detect_every, 'min_confidence': min_confidence}
+    part_files = [f'{output_file}.part{shard}' for shard in range(shards)]
+    video_parts = [f'{annotated_file}.part{shard}.mp4' if annotated_file else None for shard in range(shards)]
+
+    start = time.perf_counter()
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            frames = sum(executor.map(process_range, [input_file] * shards, part_files,
+                                      [first for first, _ in ranges], [last for _, last in ranges], range(shards),
+                                      [options] * shards, video_parts))
+
+        """
+        Ranges are in time order, so parts are simply joined
+        """
+        with open(output_file, 'wb') as output:
+            for part_file in part_files:
+                with open(part_file, 'rb') as part:
+                    shutil.copyfileobj(part, output)
+        if annotated_file:
+            writer = None
+            for video_part in video_parts:
+                part = cv2.VideoCapture(video_part)
+                while True:
+                    ret, frame = part.read()
+                    if not ret:
+                        break
+                    if writer is None:
+                        writer = cv2.VideoWriter(annotated_file, cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                                                 (frame.shape[1], frame.shape[0]))
+                    writer.write(frame)
+                part.release()
+            if writer is not None:
+                writer.release()
+    finally:
+        for part_file in part_files + video_parts:
+            if part_file and os.path.exists(part_file):
+                os.remove(part_file)
+    return frames, frames / fps, time.perf_counter() - start
+
 
+def build_arg_parser():
     """
-    Close the video if the ESC key is pressed
+    Enables to choose video source and pipeline options
+
+    Returns: argument parser
     """
-    if cv2.waitKey(1) == 27:  # Esc key
-        break
+    parser = argparse.ArgumentParser(description='Face and green color detection')
+    parser.add_argument('--source', default='0', help='Camera index or video file')
+    parser.add_argument('--queue-size', dest='queue_size', type=int, default=1,
+                        help='Frames kept between stages, the oldest are dropped')
+    parser.add_argument('--headless', action='store_true', help='Do not show windows')
+    parser.add_argument('--realtime', action='store_true', help='Read video file at its own FPS')
+    parser.add_argument('--track', action='store_true', help='Detect faces every N frames and track them between')
+    parser.add_argument('--detect-every', dest='detect_every', type=int, default=10,
+                        help='Number of frames between face detections in tracking mode')
+    parser.add_argument('--min-confidence', dest='min_confidence', type=float, default=0.5,
+                        help='Faces are detected again when smaller fraction of their points is tracked')
+    parser.add_argument('--scale', type=float, default=1.0, help='Processing scale, e.g. 0.5 halves the frame')
+    parser.add_argument('--full-sweep-every', dest='full_sweep_every', type=int, default=1,
+                        help='Frames between face searches of the whole frame, regions around faces are searched '
+                             'between them')
+    parser.add_argument('--min-face', dest='min_face', type=int, default=None, help='Minimal face size in pixels')
+    parser.add_argument('--max-face', dest='max_face', type=int, default=None, help='Maximal face size in pixels')
+    parser.add_argument('--input', help='Analyze video file offline (without windows) instead of live source')
+    parser.add_argument('--output', default='detections.jsonl', help='Json lines file for offline detections')
+    parser.add_argument('--annotated', default=None, help='Video file with circles written in offline mode')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes in offline mode')
+    parser.add_argument('--shards', type=int, default=None,
+                        help='Number of frame ranges in offline mode (default: number of workers)')
 
-"""
-Release the video capture object
-"""
-vid.release()
+    return parser
 
-"""
-Destroy all windows
-"""
-cv2.destroyAllWindows()
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    if args.input:
+        analyzed_frames, duration, elapsed = run_offline(
+            args.input, args.output, args.workers, args.shards, args.annotated, args.scale, args.full_sweep_every,
+            args.min_face, args.max_face, args.detect_every if args.track else None, args.min_confidence)
+        print(f"{analyzed_frames} frames ({duration:.1f} s of video) analyzed in {elapsed:.2f} s, "
+              f"{analyzed_frames / elapsed:.1f} FPS, {duration / elapsed:.1f}x real time")
+    else:
+        stage_stats, dropped_frames, dropped_results, face_tracker, allocated_buffers = run_pipeline(
+            int(args.source) if args.source.isdigit() else args.source, args.queue_size, args.headless,
+            args.realtime, args.detect_every if args.track else None, args.min_confidence, args.scale,
+            args.full_sweep_every, args.min_face, args.max_face)
+        for stage in stage_stats:
+            print(stage)
+        print(f"dropped: {dropped_frames} captured frames, {dropped_results} analyzed frames, "
+              f"{allocated_buffers} frame buffers allocated")
+        if face_tracker is not None:
+            print(f"face detection run on {face_tracker.detections} of {face_tracker.frames} frames, "
+                  f"{face_tracker.next_id} face ids")
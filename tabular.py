@@ -0,0 +1,94 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+"""
+Authors - Maciej Leciejewski s21484 & Krzysztof Szymczyk s23210
+
+Typed csv loader shared by NAI4 and NAI5. Csv file (without header) is parsed in chunks with explicit
+compact dtypes (int8/int16/float32, 'category' for text columns) and every column is cached as .npy file
+in .cache directory next to the csv file. The cache is rebuilt when modification time or size of the csv file
+or the dtypes change, otherwise columns are memory-mapped from the cache without parsing.
+
+Usage:
+- columns = load_csv('pima-indians-diabetes.csv', {'pregnant': 'int8', ..., 'label': 'int8'})
+"""
+
+CACHE_DIR = '.cache'
+
+
+def source_key(csv_file, dtypes):
+    """
+    Returns: values which have to be the same for the cache to be valid
+    """
+    stat = os.stat(csv_file)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'dtypes': dict(dtypes)}
+
+
+def read_typed_csv(csv_file, dtypes, chunk_size=100000):
+    """
+    Parse csv file in chunks with given dtypes
+
+    Params:
+    csv_file: path to csv file without header
+    dtypes: dict of column name -> dtype name in order of columns in file
+    chunk_size: number of rows parsed at once
+
+    Returns: dict of column name -> numpy array (pandas Categorical for 'category' columns)
+    """
+    parts = {name: [] for name in dtypes}
+    for chunk in pd.read_csv(csv_file, header=None, names=list(dtypes), dtype=dtypes, chunksize=chunk_size):
+        for name in dtypes:
+            parts[name].append(chunk[name])
+    columns = {}
+    for name, dtype in dtypes.items():
+        if dtype == 'category':
+            columns[name] = union_categoricals([part.array for part in parts[name]])
+        else:
+            columns[name] = np.concatenate([part.to_numpy() for part in parts[name]]).astype(dtype, copy=False)
+    return columns
+
+
+def load_csv(csv_file, dtypes, chunk_size=100000, cache=True):
+    """
+    Load csv file with given dtypes, from the .npy cache if csv file did not change
+
+    Params:
+    csv_file: path to csv file without header
+    dtypes: dict of column name -> dtype name in order of columns in file
+    chunk_size: number of rows parsed at once
+    cache: use and write the cache
+
+    Returns: dict of column name -> numpy array (read-only memory-mapped when loaded from the cache,
+    pandas Categorical for 'category' columns)
+    """
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_file)), CACHE_DIR, os.path.basename(csv_file))
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    key = source_key(csv_file, dtypes)
+    if cache and os.path.exists(meta_file):
+        with open(meta_file, 'r', encoding='UTF8') as f:
+            meta = json.load(f)
+        if meta['key'] == key:
+            columns = {name: np.load(os.path.join(cache_dir, f'{i}.npy'), mmap_mode='r')
+                       for i, name in enumerate(dtypes)}
+            for name, categories in meta['categories'].items():
+                columns[name] = pd.Categorical.from_codes(columns[name], categories)
+            return columns
+
+    columns = read_typed_csv(csv_file, dtypes, chunk_size)
+    if cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+        categories = {}
+        for i, (name, column) in enumerate(columns.items()):
+            if isinstance(column, pd.Categorical):
+                categories[name] = column.categories.tolist()
+                column = column.codes
+            np.save(os.path.join(cache_dir, f'{i}.npy'), column)
+        """meta file is written last, so interrupted writing leaves invalid cache"""
+        with open(meta_file, 'w', encoding='UTF8') as f:
+            json.dump({'key': key, 'rows': len(next(iter(columns.values()))), 'categories': categories}, f)
+    return columns